@@ -0,0 +1,94 @@
+"""
+Benchmark for the per-user favorites endpoint, GET /favorite/people/<user_id>.
+
+    python docs/bench_favorites.py [ROWS ...]
+
+Builds a throwaway SQLite database and grows favorite_character to each of
+ROWS (default 10000 100000 1000000) rows, then prints the mean latency of 50
+requests, through the Flask test client, for a user with 25 favorites. It
+should stay flat as the table grows: the handler reads only that user's rows,
+through the (user_id, character_id) index. "all rows" times what the handler
+used to do, loading and serializing every favorite and filtering them in
+Python, up to BEFORE_MAX_ROWS rows (beyond that it takes many seconds).
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHARACTERS = 1000
+USER_FAVORITES = 25
+REQUESTS = 50
+BEFORE_MAX_ROWS = 200000
+
+# every request must reach the database, and all of them come from one client
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["CACHE_MAX_ENTRIES"] = "0"
+os.environ["RATE_LIMITS"] = "{}"
+os.environ.pop("CACHE_URL", None)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from flask_migrate import upgrade  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Character, FavoriteCharacter, User  # noqa: E402
+
+
+def seed():
+    # 1000 characters, user 1 with USER_FAVORITES favorites
+    item = {field: "x" for field in Character.public_fields if field != "id"}
+    db.session.execute(insert(Character), [dict(item, name="Character %d" % number) for number in range(CHARACTERS)])
+    db.session.execute(insert(User).values(email="user1@example.com", password="x", is_active=True))
+    db.session.execute(
+        insert(FavoriteCharacter), [{"user_id": 1, "character_id": id} for id in range(1, USER_FAVORITES + 1)]
+    )
+    db.session.commit()
+
+
+def grow(users, rows):
+    # other users with CHARACTERS favorites each, until the table has `rows` rows; returns the user count
+    while USER_FAVORITES + (users - 1) * CHARACTERS < rows:
+        users += 1
+        db.session.execute(insert(User).values(email="user%d@example.com" % users, password="x", is_active=True))
+        db.session.execute(
+            insert(FavoriteCharacter), [{"user_id": users, "character_id": id} for id in range(1, CHARACTERS + 1)]
+        )
+    db.session.commit()
+    return users
+
+
+def mean_ms(function, times):
+    function()
+    start = time.perf_counter()
+    for _ in range(times):
+        function()
+    return (time.perf_counter() - start) / times * 1000
+
+
+def all_rows():
+    # the previous handler: every favorite loaded and serialized, then filtered
+    return [favorite.serialize() for favorite in FavoriteCharacter.query.all() if favorite.user_id == 1]
+
+
+def main(sizes):
+    client = app.test_client()
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed()
+        users = 1
+
+        def per_user():
+            response = client.get("/favorite/people/1")
+            assert response.status_code == 200 and len(response.json) == USER_FAVORITES
+
+        print("%10s  %12s  %12s" % ("rows", "per user", "all rows"))
+        for rows in sizes:
+            users = grow(users, rows)
+            total = db.session.query(FavoriteCharacter).count()
+            before = "%9.1f ms" % mean_ms(all_rows, 3) if total <= BEFORE_MAX_ROWS else "-"
+            print("%10d  %9.2f ms  %12s" % (total, mean_ms(per_user, REQUESTS), before))
+
+
+if __name__ == "__main__":
+    main([int(rows) for rows in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,95 @@
+"""
+Benchmark for GET /people/search?q=.
+
+    python docs/bench_search.py [ROWS]
+
+Loads ROWS (default 300000) characters with generated names, homeworlds and
+colors into a throwaway SQLite database and prints, for each query, how many
+rows match and the median time of 10 runs of the first page (?limit=20)
+through the Flask test client, with the cache off. The queries go from a
+selective name to one-letter prefixes matching most of the table.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 10
+QUERIES = ("skywalker", "luke sky", "tatooine", "sky", "ta", "s", "a", "blue")
+SYLLABLES = ("sky", "wal", "ker", "lu", "ke", "ta", "too", "ine", "da", "go", "bah", "an", "ak", "in", "so", "lo")
+PLANETS = ("Tatooine", "Alderaan", "Naboo", "Kashyyyk", "Dagobah", "Hoth", "Bespin", "Endor", "Coruscant", "Kamino")
+COLORS = ("blue", "brown", "red", "yellow", "black", "green", "white", "grey")
+
+# every request must reach the database, and all of them come from one client
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["CACHE_MAX_ENTRIES"] = "0"
+os.environ["RATE_LIMITS"] = "{}"
+os.environ.pop("CACHE_URL", None)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from flask_migrate import upgrade  # noqa: E402
+from sqlalchemy import insert, select, text  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Character  # noqa: E402
+from search import SEARCH_MIN_PREFIX  # noqa: E402
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def seed(rows):
+    rng = random.Random(0)
+    item = {field: "x" for field in Character.public_fields if field != "id"}
+    for start in range(0, rows, 10000):
+        batch = []
+        for _ in range(min(10000, rows - start)):
+            batch.append(
+                dict(
+                    item,
+                    name="%s %s" % (word(rng), word(rng)),
+                    homeworld=rng.choice(PLANETS),
+                    eye_color=rng.choice(COLORS),
+                    hair_color=rng.choice(COLORS),
+                )
+            )
+        db.session.execute(insert(Character), batch)
+    # one character everybody looks for
+    db.session.execute(insert(Character), [dict(item, name="Luke Skywalker", homeworld="Tatooine")])
+    db.session.commit()
+    db.session.execute(text("INSERT INTO character_fts(character_fts) VALUES ('optimize')"))
+    db.session.commit()
+
+
+def matches(q):
+    # rows matching every word, however many of them are then ranked
+    fts = " ".join('"%s"*' % term if len(term) >= SEARCH_MIN_PREFIX else '"%s"' % term for term in q.split())
+    return db.session.scalar(text("SELECT count(*) FROM character_fts WHERE character_fts MATCH :q"), {"q": fts})
+
+
+def median_ms(client, path):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        response = client.get(path)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.json
+    return sorted(times)[RUNS // 2] * 1000, response.json
+
+
+def main(rows):
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(rows)
+        client = app.test_client()
+        print("%-12s %9s %9s  %s" % ("q", "matches", "ms", "first result"))
+        for q in QUERIES:
+            ms, results = median_ms(client, "/people/search?q=%s&limit=20&fields=name" % q)
+            first = results[0]["name"] if results else "-"
+            print("%-12s %9d %9.1f  %s" % (q, matches(q), ms, first))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300000)
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark for the read path: ORM serialize() against Core projections.
+
+    python docs/bench_serialize.py [ROWS]
+
+Loads ROWS (default 50000) characters into a throwaway SQLite database and
+prints the best of 5 runs, in rows per second, for building the response
+dicts of every row:
+
+- with mapped instances and Character.serialize(), as the handlers used to;
+- with listing.projection() (Core select, dicts from Row._mapping);
+- with the same projection restricted by ?fields=name,img.
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from flask_migrate import upgrade  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from app import app  # noqa: E402
+from listing import projection  # noqa: E402
+from models import db, Character  # noqa: E402
+
+
+def orm_rows():
+    db.session.expunge_all()
+    return [character.serialize() for character in db.session.scalars(select(Character))]
+
+
+def core_rows():
+    return [dict(row._mapping) for row in db.session.execute(projection(Character))]
+
+
+def rows_per_second(function, path, rows):
+    best = float("inf")
+    for _ in range(RUNS):
+        with app.test_request_context(path):
+            start = time.perf_counter()
+            assert len(function()) == rows
+            best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def main(rows):
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        item = {field: "x" * 10 for field in Character.public_fields if field != "id"}
+        db.session.execute(insert(Character), [dict(item, name="Character %d" % number) for number in range(rows)])
+        db.session.commit()
+        for label, function, path in (
+            ("ORM query + serialize()", orm_rows, "/people"),
+            ("Core select + _mapping", core_rows, "/people"),
+            ("Core, fields=name,img", core_rows, "/people?fields=name,img"),
+        ):
+            print("%-26s %8.0f rows/s" % (label, rows_per_second(function, path, rows)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,59 @@
+"""
+Minimal HTTP load generator used for the WSGI vs ASGI comparison in the README.
+
+    python docs/loadtest.py PORT CONCURRENCY SECONDS PATH
+
+Keeps CONCURRENCY connections busy for SECONDS, one request per connection,
+and prints throughput and latency percentiles. Start the server with
+CACHE_MAX_ENTRIES=0 so that every request reaches the database, and with
+RATE_LIMITS={} SHED_MAX_POOL_WAIT_MS=0, since all the load comes from a
+single client and the point is to measure the server at saturation.
+"""
+import asyncio
+import sys
+import time
+
+TIMEOUT = 30
+
+
+async def request(port, path, latencies, errors):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), TIMEOUT)
+        writer.write(("GET %s HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n" % path).encode())
+        data = await asyncio.wait_for(reader.read(), TIMEOUT)
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        errors.append(path)
+        return
+    if data.startswith(b"HTTP/1.1 200"):
+        latencies.append(time.perf_counter() - start)
+    else:
+        errors.append(path)
+
+
+async def run(port, concurrency, seconds, path):
+    latencies, errors = [], []
+    end = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < end:
+            await request(port, path, latencies, errors)
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return sorted(latencies), errors
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return float("nan")
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+
+if __name__ == "__main__":
+    port, concurrency, seconds, path = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]), sys.argv[4]
+    latencies, errors = asyncio.run(run(port, concurrency, seconds, path))
+    print(
+        "c=%4d  %7.1f req/s  p50 %7.1f ms  p99 %7.1f ms  errors %d"
+        % (concurrency, len(latencies) / seconds, percentile(latencies, 0.5), percentile(latencies, 0.99), len(errors))
+    )
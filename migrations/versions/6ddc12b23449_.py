@@ -0,0 +1,38 @@
+"""index favorites by user
+
+Revision ID: 6ddc12b23449
+Revises: 83fc926bf283
+Create Date: 2026-10-18 10:12:41.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6ddc12b23449'
+down_revision = '83fc926bf283'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('favorite_character', schema=None) as batch_op:
+        batch_op.create_index('ix_favorite_character_user_id_character_id', ['user_id', 'character_id'], unique=False)
+
+    with op.batch_alter_table('favorite_planet', schema=None) as batch_op:
+        batch_op.create_index('ix_favorite_planet_user_id_planet_id', ['user_id', 'planet_id'], unique=False)
+
+    with op.batch_alter_table('favorite_vehicle', schema=None) as batch_op:
+        batch_op.create_index('ix_favorite_vehicle_user_id_vehicle_id', ['user_id', 'vehicle_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('favorite_vehicle', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorite_vehicle_user_id_vehicle_id')
+
+    with op.batch_alter_table('favorite_planet', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorite_planet_user_id_planet_id')
+
+    with op.batch_alter_table('favorite_character', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorite_character_user_id_character_id')
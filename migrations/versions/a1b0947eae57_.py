@@ -0,0 +1,193 @@
+"""typed shadow columns
+
+Revision ID: a1b0947eae57
+Revises: e41c0d7f9a26
+Create Date: 2026-10-18 15:19:37.198529
+
+"""
+from datetime import datetime, timezone
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1b0947eae57'
+down_revision = 'e41c0d7f9a26'
+branch_labels = None
+depends_on = None
+
+NUMERIC_FIELDS = {
+    'character': ['height', 'mass'],
+    'planet': ['diameter', 'rotation_period', 'orbital_period', 'population', 'surface_water'],
+    'vehicle': ['cost_in_credits', 'length', 'crew', 'passengers', 'max_atmosphering_speed', 'cargo_capacity'],
+}
+TIMESTAMP_FIELDS = ['created', 'edited']
+
+
+# frozen copies of models.parse_number / models.parse_timestamp
+def parse_number(value):
+    try:
+        number = float(str(value).replace(',', '').strip())
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_timestamp(value):
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def backfill(table_name):
+    # fill the new columns of existing rows, in batches
+    numeric = NUMERIC_FIELDS[table_name]
+    sources = numeric + TIMESTAMP_FIELDS
+    targets = ['%s_value' % field for field in numeric] + ['%s_at' % field for field in TIMESTAMP_FIELDS]
+    table = sa.table(
+        table_name,
+        sa.column('id'),
+        *[sa.column(name) for name in sources],
+        *[sa.column(name) for name in targets],
+    )
+    connection = op.get_bind()
+    update = table.update().where(table.c.id == sa.bindparam('row_id')).values(
+        {target: sa.bindparam(target) for target in targets}
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(table.c.id, *[table.c[name] for name in sources])
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(10000)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            values = {'row_id': row.id}
+            for field in numeric:
+                values['%s_value' % field] = parse_number(row._mapping[field])
+            for field in TIMESTAMP_FIELDS:
+                values['%s_at' % field] = parse_timestamp(row._mapping[field])
+            params.append(values)
+        connection.execute(update, params)
+        last_id = rows[-1].id
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('height_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('mass_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('edited_at', sa.DateTime(), nullable=True))
+
+    backfill('character')
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_character_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_character_edited_at'), ['edited_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_character_height_value'), ['height_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_character_mass_value'), ['mass_value'], unique=False)
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('diameter_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('rotation_period_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('orbital_period_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('population_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('surface_water_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('edited_at', sa.DateTime(), nullable=True))
+
+    backfill('planet')
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planet_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_diameter_value'), ['diameter_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_edited_at'), ['edited_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_orbital_period_value'), ['orbital_period_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_population_value'), ['population_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_rotation_period_value'), ['rotation_period_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_surface_water_value'), ['surface_water_value'], unique=False)
+
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cost_in_credits_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('length_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('crew_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('passengers_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('max_atmosphering_speed_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('cargo_capacity_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('edited_at', sa.DateTime(), nullable=True))
+
+    backfill('vehicle')
+
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vehicle_cargo_capacity_value'), ['cargo_capacity_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_cost_in_credits_value'), ['cost_in_credits_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_crew_value'), ['crew_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_edited_at'), ['edited_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_length_value'), ['length_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_max_atmosphering_speed_value'), ['max_atmosphering_speed_value'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vehicle_passengers_value'), ['passengers_value'], unique=False)
+
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    # recreate='never': rebuilding the tables would drop the full-text search triggers
+    with op.batch_alter_table('vehicle', schema=None, recreate='never') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_vehicle_passengers_value'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_max_atmosphering_speed_value'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_length_value'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_edited_at'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_crew_value'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_created_at'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_cost_in_credits_value'))
+        batch_op.drop_index(batch_op.f('ix_vehicle_cargo_capacity_value'))
+        batch_op.drop_column('edited_at')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('cargo_capacity_value')
+        batch_op.drop_column('max_atmosphering_speed_value')
+        batch_op.drop_column('passengers_value')
+        batch_op.drop_column('crew_value')
+        batch_op.drop_column('length_value')
+        batch_op.drop_column('cost_in_credits_value')
+
+    with op.batch_alter_table('planet', schema=None, recreate='never') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planet_surface_water_value'))
+        batch_op.drop_index(batch_op.f('ix_planet_rotation_period_value'))
+        batch_op.drop_index(batch_op.f('ix_planet_population_value'))
+        batch_op.drop_index(batch_op.f('ix_planet_orbital_period_value'))
+        batch_op.drop_index(batch_op.f('ix_planet_edited_at'))
+        batch_op.drop_index(batch_op.f('ix_planet_diameter_value'))
+        batch_op.drop_index(batch_op.f('ix_planet_created_at'))
+        batch_op.drop_column('edited_at')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('surface_water_value')
+        batch_op.drop_column('population_value')
+        batch_op.drop_column('orbital_period_value')
+        batch_op.drop_column('rotation_period_value')
+        batch_op.drop_column('diameter_value')
+
+    with op.batch_alter_table('character', schema=None, recreate='never') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_character_mass_value'))
+        batch_op.drop_index(batch_op.f('ix_character_height_value'))
+        batch_op.drop_index(batch_op.f('ix_character_edited_at'))
+        batch_op.drop_index(batch_op.f('ix_character_created_at'))
+        batch_op.drop_column('edited_at')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('mass_value')
+        batch_op.drop_column('height_value')
+
+    # ### end Alembic commands ###
@@ -0,0 +1,86 @@
+"""full-text search indexes on the catalogs
+
+Revision ID: b7e2f4a91c3d
+Revises: 6ddc12b23449
+Create Date: 2026-10-18 15:40:12.204871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f4a91c3d'
+down_revision = '6ddc12b23449'
+branch_labels = None
+depends_on = None
+
+# table -> searchable columns, the first one (name) weighted highest
+SEARCH_FIELDS = {
+    'character': ['name', 'homeworld', 'gender', 'hair_color', 'skin_color', 'eye_color', 'birth_year'],
+    'planet': ['name', 'climate', 'terrain'],
+    'vehicle': ['name', 'model', 'manufacturer', 'vehicle_class'],
+}
+
+
+def upgrade_sqlite(table, fields):
+    # external-content FTS5 index kept in sync with the table by triggers
+    columns = ', '.join(fields)
+    new_values = ', '.join('new.%s' % field for field in fields)
+    old_values = ', '.join('old.%s' % field for field in fields)
+    weights = ', '.join(['10.0'] + ['1.0'] * (len(fields) - 1))
+    op.execute(
+        "CREATE VIRTUAL TABLE {t}_fts USING fts5({c}, content='{t}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')".format(t=table, c=columns)
+    )
+    op.execute("INSERT INTO {t}_fts({t}_fts, rank) VALUES ('rank', 'bm25({w})')".format(t=table, w=weights))
+    op.execute("INSERT INTO {t}_fts({t}_fts) VALUES ('rebuild')".format(t=table))
+    op.execute(
+        "CREATE TRIGGER {t}_fts_insert AFTER INSERT ON {t} BEGIN "
+        "INSERT INTO {t}_fts(rowid, {c}) VALUES (new.id, {n}); END".format(t=table, c=columns, n=new_values)
+    )
+    op.execute(
+        "CREATE TRIGGER {t}_fts_delete AFTER DELETE ON {t} BEGIN "
+        "INSERT INTO {t}_fts({t}_fts, rowid, {c}) VALUES ('delete', old.id, {o}); END".format(t=table, c=columns, o=old_values)
+    )
+    op.execute(
+        "CREATE TRIGGER {t}_fts_update AFTER UPDATE ON {t} BEGIN "
+        "INSERT INTO {t}_fts({t}_fts, rowid, {c}) VALUES ('delete', old.id, {o}); "
+        "INSERT INTO {t}_fts(rowid, {c}) VALUES (new.id, {n}); END".format(t=table, c=columns, o=old_values, n=new_values)
+    )
+
+
+def upgrade_postgresql(table, fields):
+    # weighted tsvector as a stored generated column, plus trigram index on the name
+    rest = " || ' ' || ".join('coalesce(%s, \'\')' % field for field in fields[1:])
+    op.execute(
+        "ALTER TABLE {t} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce({name}, '')), 'A') || "
+        "setweight(to_tsvector('simple', {rest}), 'B')) STORED".format(t=table, name=fields[0], rest=rest)
+    )
+    op.execute('CREATE INDEX ix_{t}_search_vector ON {t} USING gin (search_vector)'.format(t=table))
+    op.execute('CREATE INDEX ix_{t}_name_trgm ON {t} USING gin (lower(name) gin_trgm_ops)'.format(t=table))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, fields in SEARCH_FIELDS.items():
+        if dialect == 'sqlite':
+            upgrade_sqlite(table, fields)
+        elif dialect == 'postgresql':
+            upgrade_postgresql(table, fields)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in SEARCH_FIELDS:
+        if dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute('DROP TRIGGER IF EXISTS {t}_fts_{x}'.format(t=table, x=trigger))
+            op.execute('DROP TABLE IF EXISTS {t}_fts'.format(t=table))
+        elif dialect == 'postgresql':
+            op.execute('DROP INDEX IF EXISTS ix_{t}_name_trgm'.format(t=table))
+            op.execute('DROP INDEX IF EXISTS ix_{t}_search_vector'.format(t=table))
+            op.execute('ALTER TABLE {t} DROP COLUMN IF EXISTS search_vector'.format(t=table))
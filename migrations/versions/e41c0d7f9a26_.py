@@ -0,0 +1,44 @@
+"""index filtered and sorted catalog columns
+
+Revision ID: e41c0d7f9a26
+Revises: b7e2f4a91c3d
+Create Date: 2026-10-18 16:21:37.640215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41c0d7f9a26'
+down_revision = 'b7e2f4a91c3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.create_index('ix_character_name_id', ['name', 'id'], unique=False)
+        batch_op.create_index('ix_character_homeworld_id', ['homeworld', 'id'], unique=False)
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.create_index('ix_planet_name_id', ['name', 'id'], unique=False)
+        batch_op.create_index('ix_planet_climate_id', ['climate', 'id'], unique=False)
+
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.create_index('ix_vehicle_name_id', ['name', 'id'], unique=False)
+        batch_op.create_index('ix_vehicle_manufacturer_id', ['manufacturer', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.drop_index('ix_vehicle_manufacturer_id')
+        batch_op.drop_index('ix_vehicle_name_id')
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.drop_index('ix_planet_climate_id')
+        batch_op.drop_index('ix_planet_name_id')
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_index('ix_character_homeworld_id')
+        batch_op.drop_index('ix_character_name_id')
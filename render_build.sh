@@ -6,6 +6,6 @@ set -o errexit
 # npm install
 # npm run build
 
-pipenv install
+pipenv install --deploy
 
 pipenv run upgrade
\ No newline at end of file
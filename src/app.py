@@ -1,15 +1,33 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
+import json
 import os
 from flask import Flask, request, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
 from utils import APIException, generate_sitemap
+from listing import fetch_entity, list_response, user_favorites
+from search import search_all, search_response
+from cache import cache
+from conditional import conditional
+from encoding import json_response, setup_json
+from batch import run_batch
+from bulk import bulk_create
+from idempotency import idempotent, purge_idempotency_keys
+from importer import import_catalog
+from popularity import add_favorite, reconcile_favorites, remove_favorite, top_response
+from pool import engine_options, instrument_pool, pool_stats
+from replicas import replica_set, stick_to_primary
 from admin import setup_admin
+from metrics import setup_metrics
+from profiling import setup_profiling
+from compression import setup_compression
+from ratelimit import setup_rate_limits
 from models import (
     db,
+    commit,
     User,
     Character,
     Vehicle,
@@ -23,6 +41,7 @@ from models import (
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+setup_json(app)
 
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
@@ -32,11 +51,34 @@ if db_url is not None:
 else:
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////tmp/test.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+# Cache-Control sent with conditional GET responses, per endpoint name
+app.config["CACHE_CONTROL_DEFAULT"] = os.getenv("CACHE_CONTROL_DEFAULT", "no-cache")
+app.config["CACHE_CONTROL"] = json.loads(os.getenv("CACHE_CONTROL", "{}"))
 
 MIGRATE = Migrate(app, db)
+app.cli.add_command(import_catalog)
+app.cli.add_command(reconcile_favorites)
+app.cli.add_command(purge_idempotency_keys)
 db.init_app(app)
+with app.app_context():
+    instrument_pool(db.engine, "primary")
+
+# Optional read replicas for GET requests, comma separated
+replica_urls = os.getenv("DATABASE_REPLICA_URLS")
+if replica_urls:
+    for url in replica_urls.split(","):
+        url = url.strip().replace("postgres://", "postgresql://")
+        replica = replica_set.add(url, **engine_options(url))
+        instrument_pool(replica.engine, replica.name)
+app.after_request(stick_to_primary)
 CORS(app)
 setup_admin(app)
+setup_metrics(app)
+setup_profiling(app)
+setup_rate_limits(app)
+# registered last so that it runs first, before metrics records the response size
+setup_compression(app)
 
 
 # Handle/serialize errors like a JSON object
@@ -51,22 +93,60 @@ def sitemap():
     return generate_sitemap(app)
 
 
+@app.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify(cache.stats()), 200
+
+
+@app.route("/pool/stats", methods=["GET"])
+def get_pool_stats():
+    return jsonify([stats.snapshot() for stats in pool_stats.values()]), 200
+
+
+@app.route("/search", methods=["GET"])
+@conditional("character", "planet", "vehicle")
+def search():
+    return search_all({"people": Character, "planets": Planet, "vehicles": Vehicle}), 200
+
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    return run_batch(request.get_json()), 200
+
+
 @app.route("/users", methods=["GET"])
+@conditional("user")
 def get_users():
-    users = User.query.all()
-    all_users = list(map(lambda x: x.serialize(), users))
-    return jsonify(all_users), 200
+    return list_response(User), 200
 
 
 @app.route("/users/<int:id>", methods=["GET"])
+@conditional("user")
 def get_user(id):
-    user = User.query.get(id)
+    user = fetch_entity(User, id)
     if user == None:
         raise APIException("User Not Found", status_code=404)
-    return jsonify(user.serialize()), 200
+    return json_response(user), 200
+
+
+@app.route("/users/<int:id>/favorites", methods=["GET"])
+@conditional("user", "favorite_character", "favorite_planet", "favorite_vehicle", "character", "planet", "vehicle")
+def get_user_favorites(id):
+    if fetch_entity(User, id) == None:
+        raise APIException("User Not Found", status_code=404)
+    expand = request.args.get("expand") in ("1", "true")
+    return jsonify(
+        {
+            "user_id": id,
+            "people": user_favorites(FavoriteCharacter, FavoriteCharacter.character, id, expand),
+            "planets": user_favorites(FavoritePlanet, FavoritePlanet.planet, id, expand),
+            "vehicles": user_favorites(FavoriteVehicle, FavoriteVehicle.vehicle, id, expand),
+        }
+    ), 200
 
 
 @app.route("/users", methods=["POST"])
+@idempotent
 def create_user():
     request_body_user = request.get_json()
     user1 = User(
@@ -75,28 +155,44 @@ def create_user():
         is_active=request_body_user["is_active"],
     )
     db.session.add(user1)
-    db.session.commit()
+    commit()
     return jsonify({"message": "User has been created"}), 200
 
 
 @app.route("/people", methods=["GET"])
+@conditional("character")
 def get_characters():
-    characters = Character.query.all()
-    all_characters = list(map(lambda x: x.serialize(), characters))
-    return jsonify(all_characters), 200
+    return list_response(Character), 200
+
+
+@app.route("/people/top", methods=["GET"])
+@conditional("character", "character_favorite_count")
+def get_top_characters():
+    return top_response(Character), 200
+
+
+@app.route("/people/search", methods=["GET"])
+@conditional("character")
+def search_characters():
+    return search_response(Character), 200
 
 
 @app.route("/people/<int:id>", methods=["GET"])
+@conditional("character")
 def get_character(id):
-    character = Character.query.get(id)
+    character = fetch_entity(Character, id)
     if character == None:
         raise APIException("Character Not Found", status_code=404)
-    return jsonify(character.serialize()), 200
+    return json_response(character), 200
 
 
 @app.route("/people", methods=["POST"])
+@idempotent
 def create_character():
     request_body_character = request.get_json()
+    if isinstance(request_body_character, list):
+        ids = bulk_create(Character, request_body_character)
+        return jsonify({"message": "Characters have been created", "ids": ids}), 200
     character1 = Character(
         name=request_body_character["name"],
         url=request_body_character["url"],
@@ -113,20 +209,23 @@ def create_character():
         img=request_body_character["img"],
     )
     db.session.add(character1)
-    db.session.commit()
+    commit()
     return jsonify({"message": "Character has been created"}), 200
 
 
 @app.route("/vehicles", methods=["GET"])
+@conditional("vehicle")
 def get_vehicles():
-    vehicles = Vehicle.query.all()
-    all_vehicles = list(map(lambda x: x.serialize(), vehicles))
-    return jsonify(all_vehicles), 200
+    return list_response(Vehicle), 200
 
 
 @app.route("/vehicles", methods=["POST"])
+@idempotent
 def create_vehicles():
     request_body_vehicle = request.get_json()
+    if isinstance(request_body_vehicle, list):
+        ids = bulk_create(Vehicle, request_body_vehicle)
+        return jsonify({"message": "Vehicles have been created", "ids": ids}), 200
     vehicle1 = Vehicle(
         name=request_body_vehicle["name"],
         url=request_body_vehicle["url"],
@@ -145,28 +244,44 @@ def create_vehicles():
         img=request_body_vehicle["img"],
     )
     db.session.add(vehicle1)
-    db.session.commit()
+    commit()
     return jsonify({"message": "Vehicle has been created"}), 200
 
 
+@app.route("/vehicles/top", methods=["GET"])
+@conditional("vehicle", "vehicle_favorite_count")
+def get_top_vehicles():
+    return top_response(Vehicle), 200
+
+
+@app.route("/vehicles/search", methods=["GET"])
+@conditional("vehicle")
+def search_vehicles():
+    return search_response(Vehicle), 200
+
+
 @app.route("/vehicles/<int:id>", methods=["GET"])
+@conditional("vehicle")
 def get_vehicle(id):
-    vehicle = Vehicle.query.get(id)
+    vehicle = fetch_entity(Vehicle, id)
     if vehicle == None:
         raise APIException("Vehicle Not Found", status_code=404)
-    return jsonify(vehicle.serialize()), 200
+    return json_response(vehicle), 200
 
 
 @app.route("/planets", methods=["GET"])
+@conditional("planet")
 def get_planets():
-    planets = Planet.query.all()
-    all_planets = list(map(lambda x: x.serialize(), planets))
-    return jsonify(all_planets), 200
+    return list_response(Planet), 200
 
 
 @app.route("/planets", methods=["POST"])
+@idempotent
 def create_planets():
     request_body_planet = request.get_json()
+    if isinstance(request_body_planet, list):
+        ids = bulk_create(Planet, request_body_planet)
+        return jsonify({"message": "Planets have been created", "ids": ids}), 200
     planet1 = Planet(
         name=request_body_planet["name"],
         url=request_body_planet["url"],
@@ -183,129 +298,109 @@ def create_planets():
         img=request_body_planet["img"],
     )
     db.session.add(planet1)
-    db.session.commit()
+    commit()
     return jsonify({"message": "Planet has been created"}), 200
 
 
+@app.route("/planets/top", methods=["GET"])
+@conditional("planet", "planet_favorite_count")
+def get_top_planets():
+    return top_response(Planet), 200
+
+
+@app.route("/planets/search", methods=["GET"])
+@conditional("planet")
+def search_planets():
+    return search_response(Planet), 200
+
+
 @app.route("/planets/<int:id>", methods=["GET"])
+@conditional("planet")
 def get_planet(id):
-    planet = Planet.query.get(id)
+    planet = fetch_entity(Planet, id)
     if planet == None:
         raise APIException("Planet Not Found", status_code=404)
-    return jsonify(planet.serialize()), 200
+    return json_response(planet), 200
 
 
 @app.route("/favorite/people", methods=["GET"])
+@conditional("favorite_character")
 def get_favoritesCharacters():
-    favorites_characters = FavoriteCharacter.query.all()
-    all_favorites_characters = list(map(lambda x: x.serialize(), favorites_characters))
-    return jsonify(all_favorites_characters), 200
+    return list_response(FavoriteCharacter), 200
 
 
 @app.route("/favorite/people/<int:user_id>", methods=["GET"])
+@conditional("favorite_character")
 def get_favoriteUserCharacters(user_id):
-    favorites_characters = FavoriteCharacter.query.all()
-    all_favorites_characters = list(map(lambda x: x.serialize(), favorites_characters))
-    all_favorites_characters = [
-        favorite_character
-        for favorite_character in all_favorites_characters
-        if favorite_character["user_id"] == user_id
-    ]
-    return jsonify(all_favorites_characters), 200
+    return list_response(FavoriteCharacter, FavoriteCharacter.user_id == user_id), 200
 
 @app.route("/favorite/people", methods=["POST"])
+@idempotent
 def create_favorite_character():
     request_body_character = request.get_json()
-    favorite_character1 = FavoriteCharacter(
-        user_id=request_body_character["user_id"],
-        character_id=request_body_character["character_id"],
-    )
-    db.session.add( favorite_character1)
-    db.session.commit()
+    add_favorite(Character, request_body_character["user_id"], request_body_character["character_id"])
+    commit()
     return jsonify({"message": "Favorite character has been added"}), 200
 
 @app.route("/favorite/people/<int:favorite_id>", methods=["DELETE"])
+@idempotent
 def delete_favoriteCharacter(favorite_id):
-    favorite_character = FavoriteCharacter.query.get(favorite_id)
-    if favorite_character == None:
+    if not remove_favorite(Character, favorite_id):
         raise APIException("Favorite Not Found", status_code=404)
-    db.session.delete(favorite_character)
-    db.session.commit()
+    commit()
     return jsonify({"message" : "Favorite deleted"}), 200
 
 @app.route("/favorite/vehicles", methods=["GET"])
+@conditional("favorite_vehicle")
 def get_favoritesVehicles():
-    favorites_vehicles = FavoriteVehicle.query.all()
-    all_favorites_vehicles = list(map(lambda x: x.serialize(), favorites_vehicles))
-    return jsonify(all_favorites_vehicles), 200
+    return list_response(FavoriteVehicle), 200
 
 @app.route("/favorite/vehicles/<int:user_id>", methods=["GET"])
+@conditional("favorite_vehicle")
 def get_favoriteUserVehicles(user_id):
-    favorites_vehicles = FavoriteVehicle.query.all()
-    all_favorites_vehicles = list(map(lambda x: x.serialize(), favorites_vehicles))
-    all_favorites_vehicles = [
-        favorite_vehicle
-        for favorite_vehicle in all_favorites_vehicles
-        if favorite_vehicle["user_id"] == user_id
-    ]
-    return jsonify(all_favorites_vehicles), 200
+    return list_response(FavoriteVehicle, FavoriteVehicle.user_id == user_id), 200
 
 @app.route("/favorite/vehicles", methods=["POST"])
+@idempotent
 def create_favorite_vehicle():
     request_body_vehicle = request.get_json()
-    favorite_vehicle1 = FavoriteVehicle(
-        user_id=request_body_vehicle["user_id"],
-        vehicle_id=request_body_vehicle["vehicle_id"],
-    )
-    db.session.add( favorite_vehicle1)
-    db.session.commit()
+    add_favorite(Vehicle, request_body_vehicle["user_id"], request_body_vehicle["vehicle_id"])
+    commit()
     return jsonify({"message": "Favorite vehicle has been added"}), 200
 
 @app.route("/favorite/vehicles/<int:favorite_id>", methods=["DELETE"])
+@idempotent
 def delete_favoriteVehicle(favorite_id):
-    favorite_vehicle = FavoriteVehicle.query.get(favorite_id)
-    if favorite_vehicle == None:
+    if not remove_favorite(Vehicle, favorite_id):
         raise APIException("Favorite Not Found", status_code=404)
-    db.session.delete(favorite_vehicle)
-    db.session.commit()
+    commit()
     return jsonify({"message" : "Favorite deleted"}), 200
 
 @app.route("/favorite/planets", methods=["GET"])
+@conditional("favorite_planet")
 def get_favoritesPlanets():
-    favorites_planets = FavoritePlanet.query.all()
-    all_favorites_planets = list(map(lambda x: x.serialize(), favorites_planets))
-    return jsonify(all_favorites_planets), 200
+    return list_response(FavoritePlanet), 200
 
 
 @app.route("/favorite/planets/<int:user_id>", methods=["GET"])
+@conditional("favorite_planet")
 def get_favoriteUserPlanets(user_id):
-    favorites_planets = FavoritePlanet.query.all()
-    all_favorites_planets = list(map(lambda x: x.serialize(), favorites_planets))
-    all_favorites_planets = [
-        favorite_planet
-        for favorite_planet in all_favorites_planets
-        if favorite_planet["user_id"] == user_id
-    ]
-    return jsonify(all_favorites_planets), 200
+    return list_response(FavoritePlanet, FavoritePlanet.user_id == user_id), 200
 
 @app.route("/favorite/planets", methods=["POST"])
+@idempotent
 def create_favorite_planet():
     request_body_planet = request.get_json()
-    favorite_planet1 = FavoritePlanet(
-        user_id=request_body_planet["user_id"],
-        planet_id=request_body_planet["planet_id"],
-    )
-    db.session.add( favorite_planet1)
-    db.session.commit()
+    add_favorite(Planet, request_body_planet["user_id"], request_body_planet["planet_id"])
+    commit()
     return jsonify({"message": "Favorite planet has been added"}), 200
 
 @app.route("/favorite/planets/<int:favorite_id>", methods=["DELETE"])
+@idempotent
 def delete_favoritePlanet(favorite_id):
-    favorite_planet = FavoritePlanet.query.get(favorite_id)
-    if favorite_planet == None:
+    if not remove_favorite(Planet, favorite_id):
         raise APIException("Favorite Not Found", status_code=404)
-    db.session.delete(favorite_planet)
-    db.session.commit()
+    commit()
     return jsonify({"message" : "Favorite deleted"}), 200
 
 if __name__ == "__main__":
@@ -0,0 +1,415 @@
+"""
+ASGI entry point: `uvicorn asgi:application --app-dir src` (or gunicorn with
+`-k uvicorn.workers.UvicornWorker`). The catalog reads run as coroutines on
+SQLAlchemy's asyncio extension, so a request waiting on the database does not
+hold a thread; every other route is handed to the regular Flask (WSGI) app.
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, jsonify, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+from app import app
+from cache import cache, cached_async, cached_many_async
+from conditional import conditional
+from encoding import json_response
+from listing import (
+    NDJSON,
+    batch_keys,
+    batch_statement,
+    encode_batch,
+    encode_entities,
+    encode_entity,
+    encode_page,
+    entity_key,
+    entity_statement,
+    favorites_statement,
+    list_key,
+    list_mode,
+    ndjson_lines,
+    page_response,
+    page_statement,
+    serialize_favorites,
+    stream_statement,
+)
+from pool import engine_options, instrument_pool
+from ratelimit import buckets
+from utils import APIException
+from models import (
+    User,
+    Character,
+    Vehicle,
+    Planet,
+    FavoriteCharacter,
+    FavoritePlanet,
+    FavoriteVehicle,
+)
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite", "mysql": "mysql+aiomysql"}
+# Requests handed to the WSGI app run in a thread pool of this size
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 10))
+# Response chunks of the WSGI app buffered ahead of the client
+WSGI_QUEUE_SIZE = 8
+
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def async_engine_options(url):
+    # same DB_POOL_* settings; the async engine brings its own asyncio-aware pool class
+    options = engine_options(url)
+    options.pop("poolclass", None)
+    return options
+
+
+database_url = os.getenv("ASYNC_DATABASE_URL") or async_database_url(app.config["SQLALCHEMY_DATABASE_URI"])
+engine = create_async_engine(database_url, **async_engine_options(str(database_url)))
+instrument_pool(engine.sync_engine, "primary-async")
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+async_views = {}
+
+
+def async_view(endpoint):
+    # Serve the Flask endpoint `endpoint` (same URL rule) with this coroutine
+    def decorator(view):
+        async_views[endpoint] = view
+        return view
+
+    return decorator
+
+
+async def list_response(model, *criteria):
+    # listing.list_response() on the async session
+    mode = list_mode(criteria)
+    if mode == "ids":
+        return await batch_response(model)
+    if mode == "stream":
+        return stream(model, criteria)
+    statement, limit = page_statement(model, criteria)
+
+    async def load():
+        async with Session() as session:
+            return encode_page(model, await session.execute(statement), limit)
+
+    page = await cached_async(model.__tablename__, list_key(), load)
+    return page_response(page, limit)
+
+
+def stream(model, criteria):
+    statement = stream_statement(model, criteria)
+
+    async def generate():
+        async with Session() as session:
+            result = await session.stream(statement)
+            async for rows in result.partitions():
+                yield ndjson_lines(rows)
+
+    # the body is an async generator, sent by serve() below
+    return Response(generate(), mimetype=NDJSON)
+
+
+async def batch_response(model):
+    ids, keys = batch_keys(model)
+
+    async def load(missing):
+        async with Session() as session:
+            return encode_entities(missing, await session.execute(batch_statement(model, missing)))
+
+    entities = await cached_many_async(model.__tablename__, keys, load)
+    return json_response(encode_batch(ids, entities))
+
+
+async def fetch_entity(model, id):
+    statement = entity_statement(model, id)
+
+    async def load():
+        async with Session() as session:
+            return encode_entity((await session.execute(statement)).first())
+
+    return await cached_async(model.__tablename__, entity_key(statement, id), load)
+
+
+async def entity_response(model, id, message):
+    entity = await fetch_entity(model, id)
+    if entity == None:
+        raise APIException(message, status_code=404)
+    return json_response(entity)
+
+
+async def user_favorites(session, model, relationship, user_id, expand):
+    favorites = (await session.scalars(favorites_statement(model, relationship, user_id, expand))).unique()
+    return serialize_favorites(favorites, relationship, expand)
+
+
+@async_view("get_users")
+@conditional("user")
+async def get_users():
+    return await list_response(User)
+
+
+@async_view("get_user")
+@conditional("user")
+async def get_user(id):
+    return await entity_response(User, id, "User Not Found")
+
+
+@async_view("get_user_favorites")
+@conditional("user", "favorite_character", "favorite_planet", "favorite_vehicle", "character", "planet", "vehicle")
+async def get_user_favorites(id):
+    if await fetch_entity(User, id) == None:
+        raise APIException("User Not Found", status_code=404)
+    expand = request.args.get("expand") in ("1", "true")
+    async with Session() as session:
+        return jsonify(
+            {
+                "user_id": id,
+                "people": await user_favorites(session, FavoriteCharacter, FavoriteCharacter.character, id, expand),
+                "planets": await user_favorites(session, FavoritePlanet, FavoritePlanet.planet, id, expand),
+                "vehicles": await user_favorites(session, FavoriteVehicle, FavoriteVehicle.vehicle, id, expand),
+            }
+        )
+
+
+@async_view("get_characters")
+@conditional("character")
+async def get_characters():
+    return await list_response(Character)
+
+
+@async_view("get_character")
+@conditional("character")
+async def get_character(id):
+    return await entity_response(Character, id, "Character Not Found")
+
+
+@async_view("get_vehicles")
+@conditional("vehicle")
+async def get_vehicles():
+    return await list_response(Vehicle)
+
+
+@async_view("get_vehicle")
+@conditional("vehicle")
+async def get_vehicle(id):
+    return await entity_response(Vehicle, id, "Vehicle Not Found")
+
+
+@async_view("get_planets")
+@conditional("planet")
+async def get_planets():
+    return await list_response(Planet)
+
+
+@async_view("get_planet")
+@conditional("planet")
+async def get_planet(id):
+    return await entity_response(Planet, id, "Planet Not Found")
+
+
+@async_view("get_favoritesCharacters")
+@conditional("favorite_character")
+async def get_favoritesCharacters():
+    return await list_response(FavoriteCharacter)
+
+
+@async_view("get_favoriteUserCharacters")
+@conditional("favorite_character")
+async def get_favoriteUserCharacters(user_id):
+    return await list_response(FavoriteCharacter, FavoriteCharacter.user_id == user_id)
+
+
+@async_view("get_favoritesVehicles")
+@conditional("favorite_vehicle")
+async def get_favoritesVehicles():
+    return await list_response(FavoriteVehicle)
+
+
+@async_view("get_favoriteUserVehicles")
+@conditional("favorite_vehicle")
+async def get_favoriteUserVehicles(user_id):
+    return await list_response(FavoriteVehicle, FavoriteVehicle.user_id == user_id)
+
+
+@async_view("get_favoritesPlanets")
+@conditional("favorite_planet")
+async def get_favoritesPlanets():
+    return await list_response(FavoritePlanet)
+
+
+@async_view("get_favoriteUserPlanets")
+@conditional("favorite_planet")
+async def get_favoriteUserPlanets(user_id):
+    return await list_response(FavoritePlanet, FavoritePlanet.user_id == user_id)
+
+
+def wsgi_environ(scope, body=b""):
+    # Enough of a WSGI environ for Flask to build its request
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope["http_version"],
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin1")
+        environ[name] = environ[name] + "," + value if name in environ else value
+    return environ
+
+
+async def run_hooks(function, *args):
+    # the request hooks make Redis round trips when the cache or the rate limits live there
+    if cache.blocking or buckets.blocking:
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+
+async def serve(view, environ, send):
+    # Flask's wsgi_app/full_dispatch_request with an awaited view: before and
+    # after request hooks, error handlers and teardown all run as usual.
+    context = app.request_context(environ)
+    error = None
+    try:
+        context.push()
+        try:
+            response = await run_hooks(app.preprocess_request)
+            if response is None:
+                response = await view(**request.view_args)
+        except Exception as e:
+            response = app.handle_user_exception(e)
+        response = await run_hooks(app.finalize_request, response)
+    except Exception as e:
+        error = e
+        response = app.handle_exception(e)
+    try:
+        await send_response(response, environ, send)
+    finally:
+        context.pop(error)
+
+
+async def send_response(response, environ, send):
+    headers = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in response.headers.to_wsgi_list()]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+    body = response.response
+    if environ["REQUEST_METHOD"] != "HEAD":
+        if hasattr(body, "__aiter__"):
+            async for chunk in body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            for chunk in response.iter_encoded():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+executor = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def run_wsgi(environ, put):
+    # In a pool thread: run the Flask app and hand its status, headers and body chunks to `put`
+    def start_response(status, headers, exc_info=None):
+        put(("start", int(status.split(" ", 1)[0]), headers))
+
+    try:
+        chunks = app.wsgi_app(environ, start_response)
+        try:
+            for chunk in chunks:
+                if chunk:
+                    put(("body", chunk))
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+    finally:
+        put(None)
+
+
+async def wsgi_application(scope, receive, send):
+    """Serve a request with the regular Flask app, in the WSGI_THREADS pool.
+
+    The app and the iteration over its body (which may stream rows from the
+    database) run in one pool thread; the chunks are passed back through a
+    bounded queue, so a slow client holds the thread rather than memory.
+    """
+    environ = wsgi_environ(scope, await read_body(receive))
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(WSGI_QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def put(item):
+        if stopped.is_set() and item is not None:
+            raise OSError("The client went away")
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    async def drain():
+        while await queue.get() is not None:
+            pass
+
+    done = loop.run_in_executor(executor, run_wsgi, environ, put)
+    try:
+        while (item := await queue.get()) is not None:
+            if item[0] == "start":
+                _, status, headers = item
+                headers = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+                await send({"type": "http.response.start", "status": status, "headers": headers})
+            else:
+                await send({"type": "http.response.body", "body": item[1], "more_body": True})
+    except BaseException:
+        # stop the app at its next chunk and unblock the thread waiting on the queue
+        stopped.set()
+        loop.create_task(drain())
+        raise
+    await done
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # asyncio.to_thread() (cache and request hooks on Redis) shares the pool
+                asyncio.get_running_loop().set_default_executor(executor)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+        environ = wsgi_environ(scope)
+        try:
+            endpoint, _ = app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        if endpoint in async_views:
+            return await serve(async_views[endpoint], environ, send)
+    await wsgi_application(scope, receive, send)
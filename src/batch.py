@@ -0,0 +1,153 @@
+import os
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from models import db
+from replicas import RoutingSession
+from encoding import encode, json_array, json_object, json_response
+from ratelimit import charge, client_key
+from utils import APIException
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 20))
+BATCH_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+# Outer request headers passed on to every sub-request (read-your-writes cookie, see replicas.py)
+INHERITED_HEADERS = ("Cookie", "X-Read-Primary")
+# Outer request headers that identify the client (see ratelimit.client_key): sub-requests cannot override them
+IDENTITY_HEADERS = ("X-API-Key", "X-Forwarded-For")
+
+
+def sub_requests(body):
+    if not isinstance(body, dict) or not isinstance(body.get("requests"), list):
+        raise APIException('Expected {"requests": [...]}', status_code=400)
+    items = body["requests"]
+    if not items:
+        raise APIException("No requests to run", status_code=400)
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise APIException("At most %d requests can be batched" % BATCH_MAX_REQUESTS, status_code=413)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str) or not item["path"].startswith("/"):
+            raise APIException("requests[%d]: path must start with /" % index, status_code=400)
+        if item.get("method", "GET").upper() not in BATCH_METHODS:
+            raise APIException("requests[%d]: unsupported method" % index, status_code=400)
+        if not isinstance(item.get("headers", {}), dict):
+            raise APIException("requests[%d]: headers must be an object" % index, status_code=400)
+    return items
+
+
+def dispatch(item):
+    """Run one sub-request through the routing and the view, and return its response.
+
+    Only the view and its error handlers run: the before/after request hooks
+    (metrics, CORS, compression...) run once, for the POST /batch request.
+    Each sub-request is still charged to the client's rate limit budget for
+    its endpoint, as if it had been sent on its own, and is seen as coming
+    from the same client (address and X-API-Key), e.g. by Idempotency-Key.
+    """
+    client = client_key()
+    headers = {name: request.headers[name] for name in INHERITED_HEADERS if name in request.headers}
+    headers.update(item.get("headers", {}))
+    identity = [name.lower() for name in IDENTITY_HEADERS]
+    headers = {name: value for name, value in headers.items() if name.lower() not in identity}
+    headers.update((name, request.headers[name]) for name in IDENTITY_HEADERS if name in request.headers)
+    kwargs = {"json": item["body"]} if "body" in item else {}
+    app = current_app._get_current_object()
+    with app.test_request_context(
+        item["path"],
+        base_url=request.root_url,
+        method=item.get("method", "GET").upper(),
+        headers=headers,
+        environ_base={"REMOTE_ADDR": request.remote_addr},
+        **kwargs
+    ):
+        if request.endpoint == "batch":
+            raise APIException("Batches cannot be nested", status_code=400)
+        response = charge(client)
+        if response is None:
+            try:
+                try:
+                    rv = app.dispatch_request()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.make_response(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+        # buffer the body while the sub-request is current: streamed bodies need it
+        response.get_data()
+        return response
+
+
+def encode_result(response):
+    # JSON bodies are embedded as they are, anything else as a string
+    body = response.get_data()
+    if response.mimetype != "application/json":
+        body = encode(body.decode("utf-8", "replace"))
+    headers = {name: value for name, value in response.headers.items() if name not in ("Content-Length", "Content-Type")}
+    return json_object({"body": body, "headers": encode(headers), "status": encode(response.status_code)})
+
+
+@contextmanager
+def one_transaction():
+    """Have the views run inside flush their changes (models.commit) for the caller to commit once.
+
+    Reads bypass the cache meanwhile, so that uncommitted rows are neither
+    served from it nor stored in it.
+    """
+    g.atomic_batch = g.cache_bypass = True
+    try:
+        yield db.session()
+    finally:
+        g.atomic_batch = g.cache_bypass = False
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def refuse_commit_in_atomic_batch(session):
+    # a plain db.session.commit() in a view would commit half of the batch
+    if has_app_context() and g.get("atomic_batch", False):
+        raise RuntimeError("Views must call models.commit(), not db.session.commit(), to run in atomic batches")
+
+
+def run_atomic(items):
+    # (results, committed): committed only when every sub-request succeeded
+    results = []
+    with one_transaction() as session:
+        try:
+            for item in items:
+                response = dispatch(item)
+                results.append(encode_result(response))
+                if response.status_code >= 400:
+                    session.rollback()
+                    return results, False
+        except Exception:
+            session.rollback()
+            raise
+    db.session.commit()
+    return results, True
+
+
+def run_each(items):
+    results = []
+    for item in items:
+        response = dispatch(item)
+        if response.status_code >= 400:
+            # drop whatever the failed view left in the session
+            db.session.rollback()
+        results.append(encode_result(response))
+    return results
+
+
+def run_batch(body):
+    """Run the sub-requests of a POST /batch body in order and respond with all their results.
+
+    Each result has the status, headers and body the request would have got
+    on its own. By default every sub-request commits its own changes. With
+    "atomic": true they share one database transaction instead, committed
+    only if all of them succeed: the first failure (status 400 or above)
+    rolls the whole batch back and the remaining requests are not run.
+    "committed" tells whether the atomic batch was committed.
+    """
+    items = sub_requests(body)
+    if body.get("atomic") is True:
+        results, committed = run_atomic(items)
+    else:
+        results, committed = run_each(items), True
+    return json_response(json_object({"committed": encode(committed), "responses": json_array(results)}))
@@ -0,0 +1,70 @@
+import os
+from functools import lru_cache
+from sqlalchemy import insert
+from models import db, commit
+from utils import APIException
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 500))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 10000))
+
+
+def writable_columns(model):
+    return [model.__table__.c[name] for name in model.public_fields if name != "id"]
+
+
+@lru_cache(maxsize=None)
+def validation_rules(model):
+    return [
+        (column.key, column.type.python_type, getattr(column.type, "length", None))
+        for column in writable_columns(model)
+    ]
+
+
+def item_errors(model, item):
+    if not isinstance(item, dict):
+        return ["expected an object"]
+    errors = []
+    for key, python_type, length in validation_rules(model):
+        value = item.get(key)
+        if isinstance(value, python_type) and not (length and len(value) > length):
+            continue
+        if value is None:
+            errors.append("%s is required" % key)
+        elif not isinstance(value, python_type):
+            errors.append("%s must be a %s" % (key, python_type.__name__))
+        else:
+            errors.append("%s is longer than %d characters" % (key, length))
+    return errors
+
+
+def bulk_create(model, items):
+    """Insert a list of JSON objects into `model` in a single transaction and return the new ids.
+
+    Every item is validated first; if any of them fails nothing is inserted
+    and the per-item errors are reported. Rows are sent in batches of
+    BULK_BATCH_SIZE as multi-row INSERTs.
+    """
+    if not items:
+        raise APIException("No items to create", status_code=400)
+    if len(items) > BULK_MAX_ITEMS:
+        raise APIException("At most %d items can be created at once" % BULK_MAX_ITEMS, status_code=413)
+    columns = writable_columns(model)
+    errors = []
+    for index, item in enumerate(items):
+        messages = item_errors(model, item)
+        if messages:
+            errors.append({"index": index, "errors": messages})
+    if errors:
+        raise APIException("Invalid items", status_code=400, payload={"errors": errors})
+
+    rows = [{column.key: item[column.key] for column in columns} for item in items]
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    ids = []
+    try:
+        for start in range(0, len(rows), BULK_BATCH_SIZE):
+            ids.extend(db.session.execute(statement, rows[start:start + BULK_BATCH_SIZE]).scalars())
+        commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ids
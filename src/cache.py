@@ -0,0 +1,364 @@
+import asyncio
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from replicas import reads_from_replica, replica_may_lag
+
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 300))
+
+MISSING = object()
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class CacheBackend:
+    """Storage used by the read-through cache.
+
+    Besides plain key/value entries a backend keeps one version counter per
+    table. Every cache key embeds the current version of its table, so bumping
+    the version after a commit makes all cached entries of that table
+    unreachable at once, for every process sharing the backend. Counters start
+    from the current time in milliseconds rather than zero so a restarted
+    process or a flushed server never reuses a version (and an ETag) that was
+    already handed out for different data.
+
+    `shared` tells whether every process sees the same versions: only then
+    do they change with every write, whichever process makes it, and can
+    serve as HTTP validators (see conditional.py).
+    """
+
+    shared = False
+    # whether calls make network round trips, which async callers run in a thread
+    blocking = False
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    # Settings (e.g. the profiling switch) are kept apart from the cache
+    # entries: never evicted to make room, and not counted as hits or misses.
+    def get_setting(self, key):
+        raise NotImplementedError
+
+    def set_setting(self, key, value, ttl):
+        # None removes the setting
+        raise NotImplementedError
+
+    def version(self, table):
+        raise NotImplementedError
+
+    def last_modified(self, table):
+        raise NotImplementedError
+
+    def bump_version(self, table):
+        raise NotImplementedError
+
+    def count(self, value):
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "ttl": self.ttl,
+        }
+
+
+class MemoryBackend(CacheBackend):
+    """Bounded, thread-safe LRU local to the process; entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._settings = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                return self.count(MISSING)
+            self._entries.move_to_end(key)
+            return self.count(entry[1])
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_setting(self, key):
+        with self._lock:
+            expires, value = self._settings.get(key, (0, None))
+            return value if expires > time.monotonic() else None
+
+    def set_setting(self, key, value, ttl):
+        with self._lock:
+            if value is None:
+                self._settings.pop(key, None)
+            else:
+                self._settings[key] = (time.monotonic() + ttl, value)
+
+    def _version(self, table):
+        if table not in self._versions:
+            self._versions[table] = (now_ms(), time.time())
+        return self._versions[table]
+
+    def version(self, table):
+        with self._lock:
+            return self._version(table)[0]
+
+    def last_modified(self, table):
+        with self._lock:
+            return self._version(table)[1]
+
+    def bump_version(self, table):
+        with self._lock:
+            self._versions[table] = (self._version(table)[0] + 1, time.time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats["entries"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+class RedisBackend(CacheBackend):
+    """Cache shared by every worker and instance through a Redis-protocol server.
+
+    `client` is a redis.Redis compatible object (fakeredis.FakeRedis works for
+    local testing). Values are pickled; eviction is left to the server's
+    maxmemory policy and the per-entry TTL.
+    """
+
+    shared = True
+    blocking = True
+
+    def __init__(self, client, ttl, prefix="cache:"):
+        super().__init__(ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return self.count(MISSING if raw is None else pickle.loads(raw))
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl or self.ttl)))
+
+    def get_many(self, keys):
+        # one round trip (MGET) for all of them
+        raws = self.client.mget([self.prefix + key for key in keys]) if keys else []
+        return [self.count(MISSING if raw is None else pickle.loads(raw)) for raw in raws]
+
+    def get_setting(self, key):
+        raw = self.client.get(self.prefix + "setting:" + key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set_setting(self, key, value, ttl):
+        if value is None:
+            self.client.delete(self.prefix + "setting:" + key)
+        else:
+            self.client.set(self.prefix + "setting:" + key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def version(self, table):
+        key = self.prefix + "version:" + table
+        version = self.client.get(key)
+        if version is None:
+            self.client.set(key, now_ms(), nx=True)
+            version = self.client.get(key)
+        return int(version)
+
+    def last_modified(self, table):
+        key = self.prefix + "modified:" + table
+        modified = self.client.get(key)
+        if modified is None:
+            self.client.set(key, time.time(), nx=True)
+            modified = self.client.get(key)
+        return float(modified)
+
+    def bump_version(self, table):
+        self.version(table)
+        self.client.incr(self.prefix + "version:" + table)
+        self.client.set(self.prefix + "modified:" + table, time.time())
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+def create_backend(url=None):
+    if url is None:
+        return MemoryBackend(CACHE_MAX_ENTRIES, CACHE_TTL)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+
+        return RedisBackend(redis.Redis.from_url(url), CACHE_TTL)
+    raise ValueError("Unsupported CACHE_URL: %s" % url)
+
+
+cache = create_backend(CACHE_URL)
+
+
+def versioned_key(table, key):
+    return "%s:%d:%s" % (table, cache.version(table), json.dumps(key, separators=(",", ":")))
+
+
+def versioned_keys(table, keys):
+    version = cache.version(table)
+    return ["%s:%d:%s" % (table, version, json.dumps(key, separators=(",", ":"))) for key in keys]
+
+
+def store(table, key, value):
+    # A replica that has not caught up with the last write must not fill the cache
+    if not (reads_from_replica() and replica_may_lag(cache.last_modified(table))):
+        cache.set(key, value)
+
+
+def bypassed():
+    # set inside atomic batches (batch.py), whose reads may see uncommitted rows
+    return has_app_context() and g.get("cache_bypass", False)
+
+
+def lookup(table, key):
+    # (versioned key, cached value or MISSING)
+    key = versioned_key(table, key)
+    return key, cache.get(key)
+
+
+def cached(table, key, loader):
+    if bypassed():
+        return loader()
+    key, value = lookup(table, key)
+    if value is MISSING:
+        value = loader()
+        store(table, key, value)
+    return value
+
+
+async def offload(function, *args):
+    """Call `function`, which uses the cache, from a coroutine without blocking the event loop.
+
+    With a backend making network round trips (Redis) it runs in the loop's
+    default executor, with the caller's context (request, g); in-process
+    backends are called directly.
+    """
+    if not cache.blocking:
+        return function(*args)
+    return await asyncio.to_thread(function, *args)
+
+
+async def cached_async(table, key, loader):
+    # Same as cached() for coroutine loaders (see asgi.py)
+    if bypassed():
+        return await loader()
+    key, value = await offload(lookup, table, key)
+    if value is MISSING:
+        value = await loader()
+        await offload(store, table, key, value)
+    return value
+
+
+def changed_tables(session):
+    return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(Session, "after_flush")
+def collect_flushed_tables(session, flush_context):
+    for instance in chain(session.new, session.dirty, session.deleted):
+        changed_tables(session).add(instance.__table__.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def collect_statement_tables(orm_execute_state):
+    # insert()/update()/delete() against a model bypass the flush
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None:
+        return
+    changed_tables(orm_execute_state.session).add(orm_execute_state.bind_mapper.local_table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_tables(session):
+    for table in session.info.pop("changed_tables", ()):
+        cache.bump_version(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_tables(session):
+    session.info.pop("changed_tables", None)
+
+
+def lookup_many(table, keys):
+    versioned = versioned_keys(table, keys)
+    return versioned, cache.get_many(versioned)
+
+
+def store_many(table, items):
+    for key, value in items:
+        store(table, key, value)
+
+
+def cached_many(table, keys, loader):
+    """Like cached() for several keys at once.
+
+    `loader` is called once, with the keys that were not cached, and returns
+    their values in the same order.
+    """
+    if bypassed():
+        return loader(keys)
+    versioned, values = lookup_many(table, keys)
+    missing = [index for index, value in enumerate(values) if value is MISSING]
+    if missing:
+        for index, value in zip(missing, loader([keys[index] for index in missing])):
+            values[index] = value
+        store_many(table, [(versioned[index], values[index]) for index in missing])
+    return values
+
+
+async def cached_many_async(table, keys, loader):
+    if bypassed():
+        return await loader(keys)
+    versioned, values = await offload(lookup_many, table, keys)
+    missing = [index for index, value in enumerate(values) if value is MISSING]
+    if missing:
+        for index, value in zip(missing, await loader([keys[index] for index in missing])):
+            values[index] = value
+        await offload(store_many, table, [(versioned[index], values[index]) for index in missing])
+    return values
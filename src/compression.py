@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import os
+from flask import request
+from cache import MISSING, cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as they are: compressing them saves less than it costs
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+# gzip level (1-9) and brotli quality (0-11)
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+COMPRESS_MIMETYPES = ("application/json", "application/x-ndjson", "text/html", "text/plain")
+
+
+def compress_gzip(body):
+    # mtime=0 keeps the output (and so the cached copy) identical for identical bodies
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def compress_brotli(body):
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+# Content-Encoding -> compressor, in order of preference
+ENCODINGS = {"br": compress_brotli, "gzip": compress_gzip} if brotli is not None else {"gzip": compress_gzip}
+
+
+def negotiate():
+    # the preferred encoding the client accepts, or None
+    return request.accept_encodings.best_match(list(ENCODINGS))
+
+
+def encoded_etag(etag, encoding):
+    # each encoding is a different representation and needs its own strong ETag
+    return "%s-%s" % (etag, encoding)
+
+
+def compressed(encoding, body):
+    """Compress `body`, reusing the copy stored under the digest of the body.
+
+    The key is derived from the bytes themselves, so a cached copy never goes
+    stale and any cache backend can hold it: repeated requests for the same
+    page are compressed once.
+    """
+    key = "compressed:%s:%s" % (encoding, hashlib.sha1(body).hexdigest())
+    data = cache.get(key)
+    if data is MISSING:
+        data = ENCODINGS[encoding](body)
+        cache.set(key, data)
+    return data
+
+
+def compress_response(response):
+    """Compress the body with the best encoding the client accepts (Accept-Encoding).
+
+    Only 200 responses of COMPRESS_MIMETYPES of at least COMPRESS_MIN_SIZE
+    bytes are compressed; streamed responses are sent as they are.
+    """
+    etag, weak = response.get_etag()
+    if response.status_code == 304 and etag is not None:
+        # answer with the ETag of the variant the client has
+        for encoding in ENCODINGS:
+            if request.if_none_match.contains(encoded_etag(etag, encoding)):
+                response.set_etag(encoded_etag(etag, encoding), weak)
+        return response
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return response
+    if response.mimetype not in COMPRESS_MIMETYPES or "Content-Encoding" in response.headers:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate()
+    if encoding is None:
+        return response
+    response.set_data(compressed(encoding, body))
+    response.headers["Content-Encoding"] = encoding
+    if etag is not None:
+        response.set_etag(encoded_etag(etag, encoding), weak)
+    return response
+
+
+def setup_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,110 @@
+import hashlib
+import inspect
+import math
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request
+from cache import bypassed, cache, offload
+from replicas import reads_from_replica, replica_may_lag
+
+
+def cache_control():
+    config = current_app.config
+    return config["CACHE_CONTROL"].get(request.endpoint, config["CACHE_CONTROL_DEFAULT"])
+
+
+def validators(tables):
+    # (etag, last modified) for the current request from the tables' versions,
+    # or None when they cannot vouch for the body (see body_etag())
+    if not cache.shared:
+        # per-process versions miss the writes of other workers, the CLI and cron jobs
+        return None
+    versions = ",".join("%s:%d" % (table, cache.version(table)) for table in tables)
+    variant = "%s %s %s" % (versions, request.full_path, request.headers.get("Accept", ""))
+    etag = hashlib.sha1(variant.encode()).hexdigest()
+    last_modified = max(cache.last_modified(table) for table in tables)
+    if reads_from_replica() and replica_may_lag(last_modified):
+        # the body may predate the current version: do not label it with validators
+        return None
+    # HTTP dates have whole seconds: round up, never to a date before the write
+    return etag, datetime.fromtimestamp(math.ceil(last_modified), timezone.utc)
+
+
+def body_etag(response):
+    # strong ETag hashed from the body itself: always right, but only known once the view ran
+    return hashlib.sha1(response.get_data()).hexdigest()
+
+
+def not_modified(etag, modified=None):
+    if request.if_none_match:
+        # compressed variants carry the ETag plus "-<encoding>", see compression.py
+        tags = request.if_none_match
+        return tags.contains(etag) or any(tag.startswith(etag + "-") for tag in tags)
+    return modified is not None and request.if_modified_since is not None and request.if_modified_since >= modified
+
+
+def label(response, etag, modified=None):
+    response.set_etag(etag)
+    if modified is not None and modified <= datetime.now(timezone.utc):
+        # until its second is over, another write could still get the same date
+        response.last_modified = modified
+    response.headers["Cache-Control"] = cache_control()
+    response.vary.add("Accept")
+    return response
+
+
+def respond(response, checked):
+    # label a 200 response of the view, or turn it into a 304 when its body ETag matches
+    response = make_response(response)
+    if response.status_code != 200:
+        return response
+    if checked is not None:
+        return label(response, *checked)
+    if response.is_streamed:
+        return response
+    etag = body_etag(response)
+    if not_modified(etag):
+        return label(current_app.response_class(status=304), etag)
+    return label(response, etag)
+
+
+def conditional(*tables):
+    """Give a GET view a strong ETag and a Last-Modified date and answer 304 when they match.
+
+    With a shared cache backend (CACHE_URL) both validators come from the
+    version counters of `tables`, which are bumped whenever a transaction
+    touching them commits, so a request whose validators still match is
+    answered before the view (and any query or serialization) runs. With
+    per-process versions the view runs and the ETag is hashed from its
+    body, which still saves sending it again; there is no Last-Modified
+    then, and streamed bodies go without validators. Reads inside an
+    atomic batch, whose body may hold rows that are rolled back later, get
+    no validators either. Works on plain and on coroutine views.
+    """
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                if bypassed():
+                    return await view(*args, **kwargs)
+                checked = await offload(validators, tables)
+                if checked is not None and not_modified(*checked):
+                    return label(current_app.response_class(status=304), *checked)
+                return respond(await view(*args, **kwargs), checked)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if bypassed():
+                return view(*args, **kwargs)
+            checked = validators(tables)
+            if checked is not None and not_modified(*checked):
+                return label(current_app.response_class(status=304), *checked)
+            return respond(view(*args, **kwargs), checked)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,89 @@
+import json
+import os
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# "orjson" (used when installed) or "json" for the standard library encoder
+JSON_ENCODER = os.getenv("JSON_ENCODER", "orjson")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's default provider plus encode(), used by the pre-encoded responses below."""
+
+    def encode(self, obj):
+        # compact UTF-8 JSON bytes
+        return json.dumps(
+            obj,
+            default=self.default,
+            ensure_ascii=self.ensure_ascii,
+            sort_keys=self.sort_keys,
+            separators=(",", ":"),
+        ).encode()
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """JSON provider backed by orjson, several times faster than the standard library.
+
+    Output matches the default provider's: keys sorted, dates formatted as
+    HTTP dates, indented in debug mode. Calls passing json.dumps() options
+    orjson does not know go to the standard library.
+    """
+
+    def options(self, indent=False):
+        # dates go through self.default, which formats them like Flask does
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def encode(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.options())
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self.options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def setup_json(app):
+    if JSON_ENCODER == "orjson" and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = StdlibJSONProvider(app)
+
+
+# Pre-encoded bodies: pages and entities are cached as JSON bytes, encoded
+# once when loaded, and sent (or joined into larger documents) as they are.
+def encode(obj):
+    return current_app.json.encode(obj)
+
+
+def json_array(fragments):
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def json_object(fragments):
+    # {key: fragment} -> JSON object, keys in order
+    return b"{" + b",".join(encode(key) + b":" + fragment for key, fragment in fragments.items()) + b"}"
+
+
+def json_response(body, status=200):
+    return current_app.response_class(body, status=status, mimetype=current_app.json.mimetype)
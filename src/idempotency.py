@@ -0,0 +1,120 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+import click
+from flask import current_app, make_response, request
+from flask.cli import with_appcontext
+from sqlalchemy import delete, update
+from models import db, commit, insert_ignoring_conflicts, IdempotencyKey
+from ratelimit import client_key
+from utils import APIException
+
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 3600))
+
+
+def now():
+    # naive UTC, like the other DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def cutoff():
+    return now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+
+
+def request_fingerprint():
+    # a key may only be reused for the very same request
+    digest = hashlib.sha256()
+    for part in (request.method, request.full_path, request.get_data()):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def scoped_key(key):
+    # keys are chosen by clients: the same key from two clients names two requests
+    return hashlib.sha256(("%s\0%s" % (client_key(), key)).encode()).hexdigest()
+
+
+def reserve(key, fingerprint):
+    # Claim `key` for this request; returns the earlier request's row when it is taken
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.created_at < cutoff()))
+    claimed = insert_ignoring_conflicts(
+        IdempotencyKey,
+        {"key": key, "fingerprint": fingerprint, "created_at": now()},
+        ["key"],
+    )
+    commit()
+    if claimed:
+        return None
+    earlier = db.session.get(IdempotencyKey, key)
+    if earlier is None:
+        raise APIException("A request with this Idempotency-Key is in progress", status_code=409)
+    return earlier
+
+
+def replay(earlier, fingerprint):
+    if earlier.fingerprint != fingerprint:
+        raise APIException("This Idempotency-Key was used for a different request", status_code=422)
+    if earlier.status_code is None:
+        raise APIException("A request with this Idempotency-Key is in progress", status_code=409)
+    response = current_app.response_class(earlier.body, status=earlier.status_code, mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def release(key):
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    commit()
+
+
+def idempotent(view):
+    """Let clients retry a write view safely by sending an Idempotency-Key header.
+
+    Keys are scoped to the client (its X-API-Key, or its address). The
+    first request with a given key runs the view and its response is
+    stored; later requests from the same client with the same key and the
+    same method, path and body get that response back (with `Idempotent-Replayed: true`) without
+    running the view again. Failed requests (errors and 5xx) release the key
+    so they can be retried. Keys expire after IDEMPOTENCY_KEY_TTL seconds.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return view(*args, **kwargs)
+        if not 0 < len(key) <= 255:
+            raise APIException("Idempotency-Key must be 1 to 255 characters long", status_code=400)
+        key = scoped_key(key)
+        fingerprint = request_fingerprint()
+        earlier = reserve(key, fingerprint)
+        if earlier is not None:
+            return replay(earlier, fingerprint)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            release(key)
+            raise
+        if response.status_code >= 500:
+            release(key)
+            return response
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(status_code=response.status_code, body=response.get_data(as_text=True))
+        )
+        commit()
+        return response
+
+    return wrapper
+
+
+@click.command("purge-idempotency-keys")
+@with_appcontext
+def purge_idempotency_keys():
+    """Delete the stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL."""
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff()))
+    db.session.commit()
+    click.echo("%d idempotency keys purged" % result.rowcount)
@@ -0,0 +1,410 @@
+import base64
+import json
+import operator
+import os
+from flask import Response, request, stream_with_context, url_for
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload
+from models import db, typed_columns
+from cache import cached, cached_many
+from encoding import encode, json_array, json_object, json_response
+from utils import APIException
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 1000))
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", 100))
+NDJSON = "application/x-ndjson"
+# Query parameters of list endpoints that are not column filters
+LIST_PARAMS = ("after", "fields", "ids", "limit", "sort", "stream")
+# Label prefix of the sort fields selected only to build the next cursor
+CURSOR_FIELD_PREFIX = "cursor_"
+# Suffixes of range filters on typed fields (?population_gt=, ?edited_since=)
+RANGE_OPERATORS = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "since": operator.ge,
+    "before": operator.lt,
+}
+
+
+# Cursors are opaque to clients: the last seen key values, as url-safe base64 JSON
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise APIException("Invalid cursor", status_code=400)
+    if not isinstance(values, list):
+        raise APIException("Invalid cursor", status_code=400)
+    return values
+
+
+def page_size():
+    limit = request.args.get("limit")
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise APIException("limit must be a positive integer", status_code=400)
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def requested_fields(model):
+    # ?fields=name,img projects the response onto those columns; id is always kept
+    fields = request.args.get("fields")
+    if not fields:
+        return model.public_fields
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in model.public_fields]
+    if unknown:
+        raise APIException("Unknown fields: %s" % ", ".join(unknown), status_code=400)
+    return ("id",) + tuple(name for name in names if name != "id")
+
+
+def projection(model):
+    # Selecting the columns directly skips ORM hydration: rows come back as
+    # tuples and are turned into response dicts through Row._mapping.
+    columns = model.__table__.c
+    return select(*[columns[name] for name in requested_fields(model)])
+
+
+def entity_statement(model, id):
+    return projection(model).where(model.id == id)
+
+
+def entity_key(statement, id):
+    return ("entity", id, tuple(column.key for column in statement.selected_columns))
+
+
+def encode_entity(row):
+    return None if row is None else encode(dict(row._mapping))
+
+
+def fetch_entity(model, id):
+    # The entity as encoded JSON (see json_response()), or None
+    statement = entity_statement(model, id)
+
+    def load():
+        return encode_entity(db.session.execute(statement).first())
+
+    return cached(model.__tablename__, entity_key(statement, id), load)
+
+
+def batch_ids():
+    # ?ids=1,5,9 -> [1, 5, 9], repeated ids dropped
+    try:
+        ids = list(dict.fromkeys(int(value) for value in request.args.get("ids", "").split(",")))
+    except ValueError:
+        raise APIException("ids must be a comma separated list of integers", status_code=400)
+    if len(ids) > BATCH_MAX_IDS:
+        raise APIException("At most %d ids can be fetched at once" % BATCH_MAX_IDS, status_code=400)
+    if any(name not in ("ids", "fields") for name in request.args):
+        raise APIException("ids can only be combined with fields", status_code=400)
+    return ids
+
+
+def batch_statement(model, keys):
+    # one query for all the entities that were not cached
+    return projection(model).where(model.id.in_([key[1] for key in keys]))
+
+
+def encode_entities(keys, rows):
+    # encoded entity (or None) for each entity key, in the order of `keys`
+    rows = {row.id: row for row in rows}
+    return [encode_entity(rows.get(key[1])) for key in keys]
+
+
+def encode_batch(ids, entities):
+    return json_object(
+        {
+            "missing": encode([id for id, entity in zip(ids, entities) if entity is None]),
+            "results": json_array([entity for entity in entities if entity is not None]),
+        }
+    )
+
+
+def batch_keys(model):
+    # (ids of ?ids=, their entity keys), see batch_response()
+    ids = batch_ids()
+    statement = projection(model)
+    return ids, [entity_key(statement, id) for id in ids]
+
+
+def batch_response(model):
+    """Respond with the `model` rows listed in ?ids=, in that order, and the ids that do not exist.
+
+    Entities share the cache of fetch_entity(): cached ones are not queried
+    again and the others are fetched with a single `WHERE id IN (...)`.
+    """
+    ids, keys = batch_keys(model)
+    entities = cached_many(
+        model.__tablename__,
+        keys,
+        lambda missing: encode_entities(missing, db.session.execute(batch_statement(model, missing))),
+    )
+    return json_response(encode_batch(ids, entities))
+
+
+def next_link(cursor, limit):
+    args = request.args.to_dict(flat=False)
+    args["after"] = cursor
+    args["limit"] = limit
+    url = url_for(request.endpoint, **(request.view_args or {}), **args, _external=True)
+    return '<%s>; rel="next"' % url
+
+
+def wants_stream():
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def filter_value(column, value):
+    if column.type.python_type is int:
+        try:
+            return int(value)
+        except ValueError:
+            raise APIException("%s must be an integer" % column.key, status_code=400)
+    return value
+
+
+def range_filter(model, name, values):
+    # ?population_gt=1e9, ?edited_since=2014-12-10: compared on the typed copy of the field
+    field, _, operation = name.rpartition("_")
+    column = typed_columns(model).get(field)
+    if column is None or operation not in RANGE_OPERATORS:
+        raise APIException("Unknown filter: %s" % name, status_code=400)
+    criteria = []
+    for value in values:
+        parsed = column.info["parse"](value)
+        if parsed is None:
+            raise APIException("Invalid value for %s: %s" % (name, value), status_code=400)
+        criteria.append(RANGE_OPERATORS[operation](column, parsed))
+    return criteria
+
+
+def list_filters(model):
+    # ?climate=arid keeps the rows with that value; repeating the parameter
+    # (?climate=arid&climate=murky) keeps the rows matching any of them
+    columns = model.__table__.c
+    criteria = []
+    for name in request.args:
+        if name in LIST_PARAMS:
+            continue
+        values = request.args.getlist(name)
+        if name not in model.public_fields:
+            criteria.extend(range_filter(model, name, values))
+            continue
+        values = [filter_value(columns[name], value) for value in values]
+        criteria.append(columns[name] == values[0] if len(values) == 1 else columns[name].in_(values))
+    return criteria
+
+
+def sort_keys(model):
+    """(field, column, descending) for each key of ?sort=-name,id.
+
+    "-" means descending. Fields with a typed copy sort on it (numerically or
+    chronologically, rows that do not parse last); id always comes last so the
+    order is total and can be resumed from a cursor.
+    """
+    columns = model.__table__.c
+    typed = typed_columns(model)
+    keys = []
+    for name in request.args.get("sort", "").split(","):
+        name = name.strip()
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        if not name or name in [field.key for field, _, _ in keys]:
+            continue
+        if name not in model.public_fields:
+            raise APIException("Unknown sort field: %s" % name, status_code=400)
+        keys.append((columns[name], typed.get(name, columns[name]), descending))
+    if "id" not in [field.key for field, _, _ in keys]:
+        keys.append((columns.id, columns.id, False))
+    return keys
+
+
+def sort_value(field, column, value):
+    # cursors carry the public field values; typed keys compare on the parsed value
+    # (bool is an int to isinstance(), not to the column)
+    if isinstance(value, bool) or not isinstance(value, field.type.python_type):
+        raise APIException("Invalid cursor", status_code=400)
+    return column.info["parse"](value) if column is not field else value
+
+
+def after_keys(keys, values):
+    # rows coming strictly after `values` in the order given by `keys`, where
+    # NULLs (typed values that did not parse) sort after everything else
+    clauses = []
+    equal = []
+    for (field, column, descending), value in zip(keys, values):
+        if value is not None:
+            after = column < value if descending else column > value
+            clauses.append(and_(*equal, or_(after, column.is_(None)) if column.nullable else after))
+        equal.append(column.is_(None) if value is None else column == value)
+    return or_(*clauses)
+
+
+def order_by(keys):
+    clauses = []
+    for field, column, descending in keys:
+        clause = column.desc() if descending else column.asc()
+        clauses.append(clause.nulls_last() if column.nullable else clause)
+    return clauses
+
+
+def list_statement(model, criteria):
+    keys = sort_keys(model)
+    statement = projection(model).where(*criteria, *list_filters(model))
+    # the cursor is built from the sort fields: those left out by ?fields= are
+    # selected under another name and dropped from the response (list_row())
+    selected = [column.key for column in statement.selected_columns]
+    statement = statement.add_columns(
+        *[field.label(CURSOR_FIELD_PREFIX + field.key) for field, _, _ in keys if field.key not in selected]
+    )
+    statement = statement.order_by(*order_by(keys))
+    after = request.args.get("after")
+    if after is not None:
+        values = decode_cursor(after)
+        if len(values) != len(keys):
+            raise APIException("Invalid cursor", status_code=400)
+        values = [sort_value(field, column, value) for (field, column, _), value in zip(keys, values)]
+        statement = statement.where(after_keys(keys, values))
+    return statement
+
+
+def list_key():
+    return ("list", request.path, tuple(sorted(request.args.items(multi=True))))
+
+
+def encode_page(model, rows, limit):
+    """Cached form of a page: (JSON body, cursor of the next page or None).
+
+    `rows` holds up to limit + 1 rows; the extra one only tells there is a
+    next page. The body is encoded once, when the page is loaded, so cache
+    hits are answered with the stored bytes.
+    """
+    rows = list(rows)
+    cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]._mapping
+        keys = [field.key if field.key in last else CURSOR_FIELD_PREFIX + field.key for field, _, _ in sort_keys(model)]
+        cursor = encode_cursor([last[key] for key in keys])
+    return encode([list_row(row) for row in rows[:limit]]), cursor
+
+
+def page_response(page, limit):
+    body, cursor = page
+    response = json_response(body)
+    if cursor is not None:
+        response.headers["Link"] = next_link(cursor, limit)
+    return response
+
+
+def list_row(row):
+    # response dict of a row of list_statement(), without the fields selected for the cursor only
+    return {key: value for key, value in row._mapping.items() if not key.startswith(CURSOR_FIELD_PREFIX)}
+
+
+def ndjson_lines(rows):
+    return b"".join(encode(list_row(row)) + b"\n" for row in rows)
+
+
+def page_statement(model, criteria):
+    # (statement, limit): the statement loads one row more than the page, see encode_page()
+    limit = page_size()
+    return list_statement(model, criteria).limit(limit + 1), limit
+
+
+def stream_statement(model, criteria):
+    return list_statement(model, criteria).execution_options(yield_per=STREAM_CHUNK_SIZE)
+
+
+def list_mode(criteria):
+    # how list_response() answers the current request: "ids", "stream" or "page"
+    if "ids" in request.args:
+        if criteria:
+            raise APIException("ids is not supported here", status_code=400)
+        return "ids"
+    return "stream" if wants_stream() else "page"
+
+
+def paginate(model, criteria):
+    statement, limit = page_statement(model, criteria)
+    page = cached(
+        model.__tablename__,
+        list_key(),
+        lambda: encode_page(model, db.session.execute(statement), limit),
+    )
+    return page_response(page, limit)
+
+
+def stream(model, criteria):
+    # Rows are fetched STREAM_CHUNK_SIZE at a time through a server-side cursor
+    # (where the driver supports one) and flushed to the client chunk by chunk.
+    statement = stream_statement(model, criteria)
+
+    def generate():
+        result = db.session.execute(statement)
+        for rows in result.partitions():
+            yield ndjson_lines(rows)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def list_response(model, *criteria):
+    """Respond with the rows of `model` matching `criteria`, ordered by id.
+
+    Query parameters named after a column add equality filters and ?sort=
+    changes the order (see list_filters() and sort_keys()). By default one page is returned
+    as a JSON list; when more rows are available the response carries a
+    `Link: <...>; rel="next"` header pointing at the next page. With
+    `?stream=1` or `Accept: application/x-ndjson` the whole result is streamed
+    instead, one JSON document per line. `?ids=1,5,9` fetches those rows
+    instead (see batch_response()).
+    """
+    mode = list_mode(criteria)
+    if mode == "ids":
+        return batch_response(model)
+    if mode == "stream":
+        return stream(model, criteria)
+    return paginate(model, criteria)
+
+
+def user_favorites(model, relationship, user_id, expand=False):
+    """Serialize a user's favorites of one kind, with the favorited entity inlined when `expand` is set.
+
+    The entities come in through a JOIN on the same query (joinedload), so the
+    cost is one query however many favorites the user has.
+    """
+    favorites = db.session.scalars(favorites_statement(model, relationship, user_id, expand)).unique()
+    return serialize_favorites(favorites, relationship, expand)
+
+
+def favorites_statement(model, relationship, user_id, expand):
+    statement = select(model).where(model.user_id == user_id).order_by(model.id)
+    if expand:
+        statement = statement.options(joinedload(relationship))
+    return statement
+
+
+def serialize_favorites(favorites, relationship, expand):
+    if not expand:
+        return [favorite.serialize() for favorite in favorites]
+    rows = []
+    for favorite in favorites:
+        row = favorite.serialize()
+        entity = getattr(favorite, relationship.key)
+        row[relationship.key] = None if entity is None else entity.serialize()
+        rows.append(row)
+    return rows
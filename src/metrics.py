@@ -0,0 +1,94 @@
+import os
+import time
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty
+# directory shared by all of them; each worker then writes its samples there
+# and /metrics aggregates the whole server.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUESTS = Counter("http_requests_total", "HTTP requests handled.", ["endpoint", "method", "status"])
+LATENCY = Histogram("http_request_duration_seconds", "Time spent handling a request.", ["endpoint"])
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of response bodies.",
+    ["endpoint"],
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000),
+)
+DB_QUERIES = Counter("http_db_queries_total", "SQL statements executed while handling requests.", ["endpoint"])
+DB_TIME = Counter("http_db_seconds_total", "Time spent in SQL statements while handling requests.", ["endpoint"])
+
+
+def endpoint_label():
+    # Unmatched URLs share one label so 404 scans cannot blow up the series count
+    return request.endpoint or "unmatched"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context() and "db_queries" in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+        # filled only while SQL profiling is on, see profiling.py
+        if "query_log" in g:
+            g.query_log.append((statement, elapsed))
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(context):
+    # a failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.statement is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def record_request(response):
+    if "request_start" not in g:
+        return response
+    endpoint = endpoint_label()
+    REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    LATENCY.labels(endpoint).observe(time.perf_counter() - g.request_start)
+    # measuring a streamed body would buffer it, so streams are left out
+    size = None if response.is_streamed else response.calculate_content_length()
+    if size is not None:
+        RESPONSE_SIZE.labels(endpoint).observe(size)
+    DB_QUERIES.labels(endpoint).inc(g.db_queries)
+    DB_TIME.labels(endpoint).inc(g.db_time)
+    return response
+
+
+def metrics():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def setup_metrics(app):
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    app.add_url_rule("/metrics", "metrics", metrics, methods=["GET"])
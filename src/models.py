@@ -1,6 +1,59 @@
+import math
+from datetime import datetime, timezone
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+def parse_number(value):
+    # "1,358" -> 1358.0; "unknown", "n/a", "30-165" and friends -> None
+    try:
+        number = float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_timestamp(value):
+    # ISO 8601 ("2014-12-09T13:50:51.644000Z", "2014-12-09") -> naive UTC datetime
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def typed_column(type_, source, parse):
+    """Indexed copy of the string column `source` parsed with `parse` (None when it does not parse).
+
+    Filled from `source` on insert (ORM and Core) and kept in sync by
+    sync_typed_columns() when the ORM updates `source`.
+    """
+
+    def default(context):
+        return parse(context.get_current_parameters().get(source))
+
+    return db.Column(type_, default=default, index=True, info={"source": source, "parse": parse})
+
+
+def typed_columns(model):
+    # public field -> its typed copy
+    return {column.info["source"]: column for column in model.__table__.c if "source" in column.info}
+
+
+def numeric_column(source):
+    return typed_column(db.Float, source, parse_number)
+
+
+def timestamp_column(source):
+    return typed_column(db.DateTime, source, parse_timestamp)
 
 
 class User(db.Model):
@@ -9,18 +62,25 @@ class User(db.Model):
     password = db.Column(db.String(80), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
 
+    # do not serialize the password, its a security breach
+    public_fields = (
+        "id",
+        "email",
+    )
+
     def __repr__(self):
         return "<User %r>" % self.email
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "email": self.email,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
 
 
 class Character(db.Model):
+    __table_args__ = (
+        db.Index("ix_character_name_id", "name", "id"),
+        db.Index("ix_character_homeworld_id", "homeworld", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     url = db.Column(db.String(100), nullable=False)
@@ -35,31 +95,52 @@ class Character(db.Model):
     created = db.Column(db.String(50), nullable=False)
     edited = db.Column(db.String(50), nullable=False)
     img = db.Column(db.String(100), nullable=False)
+    height_value = numeric_column("height")
+    mass_value = numeric_column("mass")
+    created_at = timestamp_column("created")
+    edited_at = timestamp_column("edited")
+
+    public_fields = (
+        "id",
+        "name",
+        "url",
+        "height",
+        "mass",
+        "hair_color",
+        "skin_color",
+        "eye_color",
+        "birth_year",
+        "gender",
+        "homeworld",
+        "created",
+        "edited",
+        "img",
+    )
+
+    # columns covered by the full-text search index (see search.py)
+    search_fields = (
+        "name",
+        "homeworld",
+        "gender",
+        "hair_color",
+        "skin_color",
+        "eye_color",
+        "birth_year",
+    )
 
     def __repr__(self):
         return "<Character %r>" % self.name
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "url": self.url,
-            "height": self.height,
-            "mass": self.mass,
-            "hair_color": self.hair_color,
-            "skin_color": self.skin_color,
-            "eye_color": self.eye_color,
-            "birth_year": self.birth_year,
-            "gender": self.gender,
-            "homeworld": self.homeworld,
-            "created": self.created,
-            "edited": self.edited,
-            "img": self.img,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
 
 
 class Vehicle(db.Model):
+    __table_args__ = (
+        db.Index("ix_vehicle_name_id", "name", "id"),
+        db.Index("ix_vehicle_manufacturer_id", "manufacturer", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     url = db.Column(db.String(100), nullable=False)
@@ -76,33 +157,54 @@ class Vehicle(db.Model):
     created = db.Column(db.String(50), nullable=False)
     edited = db.Column(db.String(50), nullable=False)
     img = db.Column(db.String(100), nullable=False)
+    cost_in_credits_value = numeric_column("cost_in_credits")
+    length_value = numeric_column("length")
+    crew_value = numeric_column("crew")
+    passengers_value = numeric_column("passengers")
+    max_atmosphering_speed_value = numeric_column("max_atmosphering_speed")
+    cargo_capacity_value = numeric_column("cargo_capacity")
+    created_at = timestamp_column("created")
+    edited_at = timestamp_column("edited")
+
+    public_fields = (
+        "id",
+        "name",
+        "url",
+        "model",
+        "vehicle_class",
+        "manufacturer",
+        "cost_in_credits",
+        "length",
+        "crew",
+        "passengers",
+        "max_atmosphering_speed",
+        "cargo_capacity",
+        "consumables",
+        "created",
+        "edited",
+        "img",
+    )
+
+    search_fields = (
+        "name",
+        "model",
+        "manufacturer",
+        "vehicle_class",
+    )
 
     def __repr__(self):
         return "<Vehicle %r>" % self.name
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "url": self.url,
-            "model": self.model,
-            "vehicle_class": self.vehicle_class,
-            "manufacturer": self.manufacturer,
-            "cost_in_credits": self.cost_in_credits,
-            "length": self.length,
-            "crew": self.crew,
-            "passengers": self.passengers,
-            "max_atmosphering_speed": self.max_atmosphering_speed,
-            "cargo_capacity": self.cargo_capacity,
-            "consumables": self.consumables,
-            "created": self.created,
-            "edited": self.edited,
-            "img": self.img,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
 
 
 class Planet(db.Model):
+    __table_args__ = (
+        db.Index("ix_planet_name_id", "name", "id"),
+        db.Index("ix_planet_climate_id", "climate", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     url = db.Column(db.String(100), nullable=False)
@@ -117,82 +219,191 @@ class Planet(db.Model):
     created = db.Column(db.String(50), nullable=False)
     edited = db.Column(db.String(50), nullable=False)
     img = db.Column(db.String(100), nullable=False)
+    diameter_value = numeric_column("diameter")
+    rotation_period_value = numeric_column("rotation_period")
+    orbital_period_value = numeric_column("orbital_period")
+    population_value = numeric_column("population")
+    surface_water_value = numeric_column("surface_water")
+    created_at = timestamp_column("created")
+    edited_at = timestamp_column("edited")
+
+    public_fields = (
+        "id",
+        "name",
+        "url",
+        "diameter",
+        "rotation_period",
+        "orbital_period",
+        "gravity",
+        "population",
+        "climate",
+        "terrain",
+        "surface_water",
+        "created",
+        "edited",
+        "img",
+    )
+
+    search_fields = (
+        "name",
+        "climate",
+        "terrain",
+    )
 
     def __repr__(self):
         return "<Planet %r>" % self.name
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "url": self.url,
-            "diameter": self.diameter,
-            "rotation_period": self.rotation_period,
-            "orbital_period": self.orbital_period,
-            "gravity": self.gravity,
-            "population": self.population,
-            "climate": self.climate,
-            "terrain": self.terrain,
-            "surface_water": self.surface_water,
-            "created": self.created,
-            "edited": self.edited,
-            "img": self.img,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
 
 
 class FavoriteCharacter(db.Model):
+    __table_args__ = (
+        db.Index("ix_favorite_character_user_id_character_id", "user_id", "character_id", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer(), db.ForeignKey("user.id"))
     character_id = db.Column(db.Integer(), db.ForeignKey("character.id"))
     user = db.relationship("User")
     character = db.relationship("Character")
 
+    public_fields = (
+        "id",
+        "user_id",
+        "character_id",
+    )
+
     def __repr__(self):
         return "<Favorite %r>" % self.id
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "character_id": self.character_id,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
 
 
 class FavoriteVehicle(db.Model):
+    __table_args__ = (
+        db.Index("ix_favorite_vehicle_user_id_vehicle_id", "user_id", "vehicle_id", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer(), db.ForeignKey("user.id"))
     vehicle_id = db.Column(db.Integer(), db.ForeignKey("vehicle.id"))
     user = db.relationship("User")
     vehicle = db.relationship("Vehicle")
 
+    public_fields = (
+        "id",
+        "user_id",
+        "vehicle_id",
+    )
+
     def __repr__(self):
         return "<Favorite %r>" % self.id
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "vehicle_id": self.vehicle_id,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
 
 
 class FavoritePlanet(db.Model):
+    __table_args__ = (
+        db.Index("ix_favorite_planet_user_id_planet_id", "user_id", "planet_id", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer(), db.ForeignKey("user.id"))
     planet_id = db.Column(db.Integer(), db.ForeignKey("planet.id"))
     user = db.relationship("User")
     planet = db.relationship("Planet")
 
+    public_fields = (
+        "id",
+        "user_id",
+        "planet_id",
+    )
+
     def __repr__(self):
         return "<Favorite %r>" % self.id
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "planet_id": self.planet_id,
-            # do not serialize the password, its a security breach
-        }
+        return {field: getattr(self, field) for field in self.public_fields}
+
+
+# Favorite counters, one row per favorited entity, see popularity.py. They live
+# apart from the catalog tables so that favorite writes leave the catalogs'
+# cache versions (and so their cached pages and ETags) alone.
+class CharacterFavoriteCount(db.Model):
+    __table_args__ = (db.Index("ix_character_favorite_count_count_character_id", "count", "character_id"),)
+
+    character_id = db.Column(db.Integer(), db.ForeignKey("character.id"), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, server_default="0")
+
+
+class VehicleFavoriteCount(db.Model):
+    __table_args__ = (db.Index("ix_vehicle_favorite_count_count_vehicle_id", "count", "vehicle_id"),)
+
+    vehicle_id = db.Column(db.Integer(), db.ForeignKey("vehicle.id"), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, server_default="0")
+
+
+class PlanetFavoriteCount(db.Model):
+    __table_args__ = (db.Index("ix_planet_favorite_count_count_planet_id", "count", "planet_id"),)
+
+    planet_id = db.Column(db.Integer(), db.ForeignKey("planet.id"), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, server_default="0")
+
+
+class IdempotencyKey(db.Model):
+    # response of a write sent with an Idempotency-Key header, keyed by a hash of
+    # the client and its key, see idempotency.py
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return "<IdempotencyKey %r>" % self.key
+
+
+def insert_ignoring_conflicts(model, values, conflict_columns):
+    """Insert one `model` row unless one with the same `conflict_columns` (a unique index) exists.
+
+    Runs as a single INSERT ... ON CONFLICT DO NOTHING on PostgreSQL and
+    SQLite, so a duplicate costs one index probe and never aborts the
+    transaction. Returns True when the row was inserted.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = postgresql.insert(model) if dialect == "postgresql" else sqlite.insert(model)
+        statement = statement.values(values).on_conflict_do_nothing(index_elements=conflict_columns)
+        returning = model.__table__.primary_key.columns
+        return db.session.execute(statement.returning(*returning)).first() is not None
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(model).values(values))
+    except IntegrityError:
+        return False
+    return True
+
+
+def commit():
+    """Commit the changes of the current view, or only flush them inside an atomic POST /batch.
+
+    The batch (see batch.py) commits or rolls back all of its sub-requests
+    at once; views and helpers that write call this instead of
+    db.session.commit().
+    """
+    if has_app_context() and g.get("atomic_batch", False):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+@event.listens_for(db.Model, "before_update", propagate=True)
+def sync_typed_columns(mapper, connection, target):
+    state = inspect(target)
+    for column in mapper.local_table.c:
+        source = column.info.get("source")
+        if source is not None and state.attrs[source].history.has_changes():
+            setattr(target, column.key, column.info["parse"](getattr(target, source)))
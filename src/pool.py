@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds (seconds) of the pool wait time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+pool_stats = {}
+
+
+def env_flag(name):
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+def engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* / DB_MAX_OVERFLOW environment variables."""
+    options = {}
+    for option, variable, cast in (
+        ("pool_size", "DB_POOL_SIZE", int),
+        ("max_overflow", "DB_MAX_OVERFLOW", int),
+        ("pool_timeout", "DB_POOL_TIMEOUT", float),
+        ("pool_recycle", "DB_POOL_RECYCLE", int),
+    ):
+        if os.getenv(variable):
+            options[option] = cast(os.getenv(variable))
+    if env_flag("DB_POOL_PRE_PING"):
+        options["pool_pre_ping"] = True
+    # in-memory SQLite needs its single shared connection, everything else gets a timed QueuePool
+    if database_uri not in ("sqlite://", "sqlite:///:memory:"):
+        options["poolclass"] = InstrumentedQueuePool
+    return options
+
+
+class PoolStats:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        # start times of the checkouts waiting right now, read by the load shedder (ratelimit.py)
+        self.waiting = {}
+        self._lock = threading.Lock()
+
+    def observe_wait(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += seconds
+            self.wait_buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def current_wait(self):
+        # how long the longest waiting checkout has been waiting so far, 0 when none is
+        starts = list(self.waiting.values())
+        return time.perf_counter() - min(starts) if starts else 0.0
+
+    def snapshot(self):
+        pool = self.pool
+        snapshot = {
+            "name": self.name,
+            "pool": type(pool).__name__,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+        }
+        if isinstance(pool, QueuePool):
+            snapshot.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip(WAIT_BUCKETS + ("+Inf",), self.wait_buckets):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        snapshot["wait_seconds"] = {"count": self.wait_count, "sum": self.wait_sum, "buckets": histogram}
+        return snapshot
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long callers wait to get a connection.
+
+    There is no pool event fired before a checkout starts, so the wait is
+    measured around connect(); everything else is collected by the pool
+    event listeners installed in instrument_pool().
+    """
+
+    stats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        token = object()
+        if self.stats is not None:
+            self.stats.waiting[token] = start
+        try:
+            return super().connect()
+        except TimeoutError:
+            if self.stats is not None:
+                self.stats.timeouts += 1
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.waiting.pop(token, None)
+                self.stats.observe_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        if pool.stats is not None:
+            pool.stats.pool = pool
+        return pool
+
+
+def instrument_pool(engine, name):
+    stats = pool_stats[name] = PoolStats(name, engine.pool)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.stats = stats
+
+    @event.listens_for(engine.pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
+
+    @event.listens_for(engine.pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+
+    @event.listens_for(engine.pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        stats.checkins += 1
+
+    @event.listens_for(engine.pool, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidations += 1
+
+    return stats
@@ -0,0 +1,120 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select, update
+from models import (
+    db,
+    insert_ignoring_conflicts,
+    Character,
+    Planet,
+    Vehicle,
+    FavoriteCharacter,
+    FavoritePlanet,
+    FavoriteVehicle,
+    CharacterFavoriteCount,
+    PlanetFavoriteCount,
+    VehicleFavoriteCount,
+)
+from cache import cache, cached
+from encoding import encode, json_response
+from listing import list_key, page_size, projection
+
+# entity model -> (favorite model, its foreign key column, counter key column)
+FAVORITES = {
+    Character: (FavoriteCharacter, FavoriteCharacter.character_id, CharacterFavoriteCount.character_id),
+    Planet: (FavoritePlanet, FavoritePlanet.planet_id, PlanetFavoriteCount.planet_id),
+    Vehicle: (FavoriteVehicle, FavoriteVehicle.vehicle_id, VehicleFavoriteCount.vehicle_id),
+}
+
+
+def adjust_favorite_count(model, id, delta):
+    # runs in the caller's transaction, committed together with the favorite row
+    _, _, counter_key = FAVORITES[model]
+    counter = counter_key.class_
+    if delta > 0:
+        insert_ignoring_conflicts(counter, {counter_key.key: id, "count": 0}, [counter_key.key])
+    db.session.execute(update(counter).where(counter_key == id).values(count=counter.count + delta))
+
+
+def add_favorite(model, user_id, id):
+    """Favorite the `model` row `id` for `user_id` and count it, unless the user already did.
+
+    Returns True when a favorite was added. Repeating the request is harmless:
+    the duplicate is skipped by the unique (user_id, id) index and the counter
+    is left alone.
+    """
+    favorite, key, _ = FAVORITES[model]
+    added = insert_ignoring_conflicts(favorite, {"user_id": user_id, key.key: id}, ["user_id", key.key])
+    if added:
+        adjust_favorite_count(model, id, 1)
+    return added
+
+
+def remove_favorite(model, favorite_id):
+    # Delete the favorite and uncount it; False when it does not exist (anymore)
+    favorite, key, _ = FAVORITES[model]
+    # first() tells a deleted favorite with no entity (NULL key) from a missing one
+    deleted = db.session.execute(delete(favorite).where(favorite.id == favorite_id).returning(key)).first()
+    if deleted is None:
+        return False
+    if deleted[0] is not None:
+        adjust_favorite_count(model, deleted[0], -1)
+    return True
+
+
+def top_response(model):
+    """Respond with the `limit` most favorited rows of `model`, each with its favorite_count.
+
+    Reads the counters backwards along their (count, id) index and joins the
+    rows they point to, so no favorites table is scanned.
+    """
+    _, _, counter_key = FAVORITES[model]
+    counter = counter_key.class_
+    limit = page_size()
+    statement = (
+        projection(model)
+        .add_columns(counter.count.label("favorite_count"))
+        .join(counter, counter_key == model.id)
+        .where(counter.count > 0)
+        .order_by(counter.count.desc(), counter_key.desc())
+        .limit(limit)
+    )
+    # cached under the counters' version, with the catalog's in the key: a change to either reloads it
+    body = cached(
+        counter.__tablename__,
+        list_key() + (cache.version(model.__tablename__),),
+        lambda: encode([dict(row._mapping) for row in db.session.execute(statement)]),
+    )
+    return json_response(body)
+
+
+def reconcile(model):
+    # fix the counters that differ from the actual count, then add the missing ones
+    favorite, key, counter_key = FAVORITES[model]
+    counter = counter_key.class_
+    actual = select(func.count()).where(key == counter_key).scalar_subquery()
+    fixed = db.session.execute(
+        update(counter).where(counter.count != actual).values(count=actual),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    missing = (
+        select(key, func.count())
+        .where(key.is_not(None), key.not_in(select(counter_key)))
+        .group_by(key)
+    )
+    added = db.session.execute(insert(counter).from_select([counter_key.key, "count"], missing)).rowcount
+    return fixed + added
+
+
+@click.command("reconcile-favorites")
+@with_appcontext
+def reconcile_favorites():
+    """Recount the favorites of every character, planet and vehicle and fix counters that drifted.
+
+    The counters are kept up to date by the favorite endpoints; run this
+    periodically (see render.yml) to repair changes made around them, e.g.
+    through the admin or by hand in the database.
+    """
+    for model in FAVORITES:
+        fixed = reconcile(model)
+        db.session.commit()
+        click.echo("%s: %d counters fixed" % (model.__tablename__, fixed))
@@ -0,0 +1,126 @@
+import hmac
+import os
+import re
+import time
+from collections import Counter
+from flask import current_app, g, jsonify, request
+from cache import cache
+from utils import APIException
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 3))
+# Longest a PUT /profiling may switch profiling on for, in seconds
+PROFILING_MAX_DURATION = int(os.getenv("PROFILING_MAX_DURATION", 3600))
+STATE_KEY = "profiling:state"
+STATE_POLL_INTERVAL = 2.0
+
+# The on/off switch lives in the cache backend so one PUT reaches every worker
+# sharing it (CACHE_URL); with the default in-process cache it only reaches the
+# worker that served the PUT. Each process re-reads it at most every
+# STATE_POLL_INTERVAL seconds.
+_state = {"value": None, "read_at": 0.0}
+
+
+def profiling_state():
+    now = time.monotonic()
+    if now - _state["read_at"] > STATE_POLL_INTERVAL:
+        _state["value"] = cache.get_setting(STATE_KEY)
+        _state["read_at"] = now
+    return _state["value"]
+
+
+def authorized():
+    # nobody is, unless a PROFILING_TOKEN is configured
+    if PROFILING_TOKEN is None:
+        return False
+    return hmac.compare_digest(request.headers.get("Authorization", ""), "Bearer " + PROFILING_TOKEN)
+
+
+def statement_shape(statement):
+    # Same query with different literals or IN-list lengths counts as one shape
+    shape = re.sub(r"\b\d+(\.\d+)?\b", "?", statement)
+    shape = re.sub(r"\(\s*\?(\s*,\s*\?)*\s*\)", "(?)", shape)
+    return " ".join(shape.split())
+
+
+def start_profiling():
+    state = profiling_state()
+    if state is None and not (request.headers.get("X-Profile") and authorized()):
+        return
+    g.query_log = []
+    g.profiling = {"slow_query_ms": SLOW_QUERY_MS, "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD}
+    g.profiling.update(state or {})
+    g.profiling_start = time.perf_counter()
+
+
+def report_profile(response):
+    if "profiling" not in g:
+        return response
+    total_ms = (time.perf_counter() - g.profiling_start) * 1000
+    queries = g.query_log
+    db_ms = sum(elapsed for _, elapsed in queries) * 1000
+    slow_ms = g.profiling["slow_query_ms"]
+    shapes = Counter(statement_shape(statement) for statement, _ in queries)
+    repeated = {shape: count for shape, count in shapes.items() if count >= g.profiling["n_plus_one_threshold"]}
+
+    lines = ["%s %s: %d queries, %.1f ms in SQL, %.1f ms total" % (request.method, request.full_path.rstrip("?"), len(queries), db_ms, total_ms)]
+    for statement, elapsed in queries:
+        flag = "SLOW " if elapsed * 1000 >= slow_ms else ""
+        lines.append("  %s%8.2f ms  %s" % (flag, elapsed * 1000, " ".join(statement.split())))
+    for shape, count in repeated.items():
+        lines.append("  N+1? %d x %s" % (count, shape))
+    current_app.logger.warning("\n".join(lines))
+
+    response.headers["Server-Timing"] = 'db;dur=%.2f;desc="%d queries", app;dur=%.2f' % (db_ms, len(queries), total_ms)
+    return response
+
+
+def get_profiling():
+    state = profiling_state()
+    return jsonify({"enabled": state is not None, "settings": state, "shared": cache.shared}), 200
+
+
+def set_profiling():
+    if PROFILING_TOKEN is None:
+        raise APIException("Profiling is disabled: set PROFILING_TOKEN to allow it", status_code=403)
+    if not authorized():
+        raise APIException("Unauthorized", status_code=401)
+    body = request.get_json() or {}
+    if not body.get("enabled"):
+        cache.set_setting(STATE_KEY, None, ttl=None)
+        _state["read_at"] = 0.0
+        return jsonify({"enabled": False, "shared": cache.shared}), 200
+    try:
+        state = {
+            "slow_query_ms": float(body.get("slow_query_ms", SLOW_QUERY_MS)),
+            "n_plus_one_threshold": int(body.get("n_plus_one_threshold", N_PLUS_ONE_THRESHOLD)),
+        }
+        duration = int(body.get("duration", PROFILING_MAX_DURATION))
+    except (TypeError, ValueError):
+        raise APIException("slow_query_ms, n_plus_one_threshold and duration must be numbers", status_code=400)
+    if duration <= 0:
+        raise APIException("duration must be positive", status_code=400)
+    # Profiling switches itself off again after `duration` seconds (one hour at most by default)
+    cache.set_setting(STATE_KEY, state, ttl=min(duration, PROFILING_MAX_DURATION))
+    _state["read_at"] = 0.0
+    return jsonify({"enabled": True, "settings": state, "shared": cache.shared}), 200
+
+
+def setup_profiling(app):
+    """SQL profiling that can be switched on at runtime with PUT /profiling.
+
+    Only available with a PROFILING_TOKEN, sent as a bearer token. While it
+    is on (or for a single request sent with an `X-Profile: 1` header and
+    the token) every statement of a request is logged with its timing, slow
+    statements and repeated statement shapes (likely N+1 patterns) are
+    flagged, and responses get a Server-Timing header.
+
+    The switch is kept in the cache backend: it reaches every worker only
+    with a shared one (CACHE_URL). Otherwise a PUT only switches the worker
+    that served it, which responses tell with `"shared": false`.
+    """
+    app.before_request(start_profiling)
+    app.after_request(report_profile)
+    app.add_url_rule("/profiling", "get_profiling", get_profiling, methods=["GET"])
+    app.add_url_rule("/profiling", "set_profiling", set_profiling, methods=["PUT"])
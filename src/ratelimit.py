@@ -0,0 +1,184 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import jsonify, request
+from pool import pool_stats
+
+# Token bucket budgets, [tokens per second, burst], per client and per endpoint
+# name; "write" covers the other POST/PUT/PATCH/DELETE routes and "default"
+# everything else. RATE_LIMITS={} turns rate limiting off.
+RATE_LIMITS = json.loads(os.getenv("RATE_LIMITS", '{"default": [50, 100], "write": [10, 20]}'))
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))
+# Number of reverse proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", 0))
+# Load shedding: 503 once this many requests are in progress in the process
+# (0 = no limit) or while a request has been waiting longer than
+# SHED_MAX_POOL_WAIT_MS for a database connection (0 = never)
+SHED_MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", 0))
+SHED_MAX_POOL_WAIT_MS = float(os.getenv("SHED_MAX_POOL_WAIT_MS", 1000))
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", 1))
+EXEMPT_ENDPOINTS = ("metrics", "static")
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class MemoryBuckets:
+    """Token buckets kept in the process: each worker enforces the budgets on its own.
+
+    At most `max_clients` buckets are kept; the least recently used ones go
+    first, which at worst hands a forgotten client a full bucket again.
+    """
+
+    blocking = False
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        # 0 when a token was taken, else the seconds until the next one
+        now = time.monotonic()
+        with self._lock:
+            tokens, at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - at) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker and instance, updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+    local tokens = tonumber(bucket[1]) or burst
+    local at = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+    blocking = True
+
+    def __init__(self, client, prefix="ratelimit:"):
+        self.prefix = prefix
+        self.script = client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst):
+        return float(self.script(keys=[self.prefix + key], args=[rate, burst]))
+
+
+def create_buckets(url=None):
+    if url is None:
+        return MemoryBuckets(RATE_LIMIT_MAX_CLIENTS)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+
+        return RedisBuckets(redis.Redis.from_url(url))
+    raise ValueError("Unsupported RATE_LIMIT_URL: %s" % url)
+
+
+buckets = create_buckets(RATE_LIMIT_URL)
+in_flight = 0
+in_flight_lock = threading.Lock()
+
+
+def client_key():
+    # the API key when the client sends one, its address otherwise
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()
+    route = request.access_route
+    if TRUSTED_PROXIES and len(route) >= TRUSTED_PROXIES:
+        return "ip:" + route[-TRUSTED_PROXIES]
+    return "ip:%s" % request.remote_addr
+
+
+def budget():
+    # (name, [rate, burst]) applying to the current request, or None
+    for name in (request.endpoint, "write" if request.method not in SAFE_METHODS else None, "default"):
+        if name in RATE_LIMITS:
+            return name, RATE_LIMITS[name]
+    return None
+
+
+def pool_wait_ms():
+    return max([stats.current_wait() for stats in pool_stats.values()] or [0]) * 1000
+
+
+def refuse(status, message, retry_after):
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def exempt():
+    return request.endpoint in EXEMPT_ENDPOINTS or request.method == "OPTIONS"
+
+
+def charge(client=None):
+    """Take a token from `client`'s bucket for the current request; a 429 response when there is none.
+
+    `client` defaults to the current request's client_key(); POST /batch
+    passes the outer request's key so each sub-request is charged to it.
+    """
+    limit = budget()
+    if limit is None or exempt():
+        return None
+    name, (rate, burst) = limit
+    wait = buckets.take("%s:%s" % (name, client or client_key()), rate, burst)
+    if wait:
+        return refuse(429, "Too many requests", wait)
+    return None
+
+
+def limit_request():
+    global in_flight
+    if exempt():
+        return None
+    refusal = charge()
+    if refusal is not None:
+        return refusal
+    if SHED_MAX_POOL_WAIT_MS and pool_wait_ms() > SHED_MAX_POOL_WAIT_MS:
+        return refuse(503, "The server is overloaded, retry later", SHED_RETRY_AFTER)
+    with in_flight_lock:
+        if SHED_MAX_IN_FLIGHT and in_flight >= SHED_MAX_IN_FLIGHT:
+            return refuse(503, "The server is overloaded, retry later", SHED_RETRY_AFTER)
+        in_flight += 1
+    # on the request itself, not on g: batch sub-requests share g and tear down on their own
+    request.environ["ratelimit.in_flight"] = True
+    return None
+
+
+def end_request(exception):
+    global in_flight
+    if request.environ.pop("ratelimit.in_flight", False):
+        with in_flight_lock:
+            in_flight -= 1
+
+
+def setup_rate_limits(app):
+    """Per-client token bucket rate limits (429) and load shedding (503), both with Retry-After.
+
+    A request is first charged to its client's bucket for the endpoint (see
+    RATE_LIMITS); then it is shed when the process already has
+    SHED_MAX_IN_FLIGHT requests in progress or when a request has already
+    waited more than SHED_MAX_POOL_WAIT_MS for a database connection: the
+    queue in front of the pool is then too long for a new request to be
+    served in time.
+    """
+    app.before_request(limit_request)
+    app.teardown_request(end_request)
@@ -0,0 +1,146 @@
+import itertools
+import os
+import threading
+import time
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, make_url, orm as sa_orm, text
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql import Select
+
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", 30))
+# Seconds the health check of a replica that is down may wait to connect
+REPLICA_PROBE_TIMEOUT = int(os.getenv("REPLICA_PROBE_TIMEOUT", 2))
+# How far replicas may trail the primary; also how long a client reads from
+# the primary after its own write (read-your-writes).
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+
+class Replica:
+    def __init__(self, name, engine, probe_engine):
+        self.name = name
+        self.engine = engine
+        # unpooled, with a connect timeout: a replica that hangs fails its probe
+        self.probe_engine = probe_engine
+        self.down_until = 0.0
+        self._probing = threading.Lock()
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + REPLICA_RETRY_INTERVAL
+
+    def available(self):
+        # Never blocks: a replica due for a retry is health checked in the background
+        if self.down_until == 0.0:
+            return True
+        if time.monotonic() >= self.down_until and self._probing.acquire(blocking=False):
+            threading.Thread(target=self.probe, name="probe-" + self.name, daemon=True).start()
+        return False
+
+    def probe(self):
+        # Health check before putting the replica back into rotation
+        try:
+            with self.probe_engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down()
+        else:
+            self.down_until = 0.0
+        finally:
+            self._probing.release()
+
+
+def probe_connect_args(url):
+    if make_url(url).get_backend_name() in ("postgresql", "mysql"):
+        return {"connect_timeout": REPLICA_PROBE_TIMEOUT}
+    return {}
+
+
+class ReplicaSet:
+    def __init__(self):
+        self.replicas = []
+        self._cycle = None
+        self._lock = threading.Lock()
+
+    def add(self, url, **engine_options):
+        replica = Replica(
+            "replica-%d" % (len(self.replicas) + 1),
+            create_engine(url, **engine_options),
+            create_engine(url, poolclass=NullPool, connect_args=probe_connect_args(url)),
+        )
+        self.watch(replica)
+        with self._lock:
+            self.replicas.append(replica)
+            self._cycle = itertools.cycle(self.replicas)
+        return replica
+
+    def watch(self, replica):
+        # Replicas only ever run SELECTs, so any database error takes one out of rotation
+        @event.listens_for(replica.engine, "handle_error")
+        def drop_failing_replica(context):
+            replica.mark_down()
+
+    def choose(self):
+        # Round-robin over the replicas that are up; None means "use the primary"
+        with self._lock:
+            candidates = [next(self._cycle) for _ in range(len(self.replicas))]
+        for replica in candidates:
+            if replica.available():
+                return replica
+        return None
+
+
+replica_set = ReplicaSet()
+
+
+def reads_from_replica():
+    if not replica_set.replicas or not has_request_context():
+        return False
+    if request.method not in ("GET", "HEAD") or request.headers.get("X-Read-Primary"):
+        return False
+    try:
+        read_primary_until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        read_primary_until = 0
+    return read_primary_until < time.time()
+
+
+def replica_may_lag(last_modified):
+    # Data written at `last_modified` may not have reached the replicas yet
+    return time.time() - last_modified < REPLICA_MAX_LAG
+
+
+def stick_to_primary(response):
+    # after_request hook: a client that just wrote reads from the primary for a while
+    if replica_set.replicas and g.get("committed_writes"):
+        until = time.time() + REPLICA_MAX_LAG
+        response.set_cookie(READ_PRIMARY_COOKIE, "%.3f" % until, max_age=int(REPLICA_MAX_LAG) + 1)
+    return response
+
+
+class RoutingSession(Session):
+    """Session sending plain SELECTs of GET requests to a replica, everything else to the primary.
+
+    Flushes, insert/update/delete statements and any statement issued after
+    the session wrote something stay on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and not self.info.get("changed_tables")
+            and reads_from_replica()
+        ):
+            replica = replica_set.choose()
+            if replica is not None:
+                return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Inserted first so it runs before the cache listener clears changed_tables
+@event.listens_for(sa_orm.Session, "after_commit", insert=True)
+def remember_committed_writes(session):
+    if session.info.get("changed_tables") and has_request_context():
+        g.committed_writes = True
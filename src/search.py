@@ -0,0 +1,150 @@
+import os
+import re
+from flask import request
+from sqlalchemy import Double, and_, cast, column, func, literal_column, or_, select, table, union_all
+from models import db
+from cache import cached
+from encoding import encode, json_object, json_response
+from listing import decode_cursor, encode_cursor, list_key, next_link, page_size, requested_fields
+from utils import APIException
+
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", 8))
+# Shorter words of ?q= are matched as whole words, not as prefixes
+SEARCH_MIN_PREFIX = int(os.getenv("SEARCH_MIN_PREFIX", 2))
+# Matches ranked per query, those matching in the name first (see candidates())
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 1000))
+
+
+def search_terms():
+    # Words of ?q=, each one matched as a prefix ("luk sky" finds Luke Skywalker)
+    # when it has at least SEARCH_MIN_PREFIX characters
+    terms = re.findall(r"\w+", request.args.get("q", "").lower())
+    if not terms:
+        raise APIException("q must contain at least one word", status_code=400)
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def search_cursor():
+    after = request.args.get("after")
+    if after is None:
+        return None
+    values = decode_cursor(after)
+    if len(values) != 2 or not all(isinstance(value, (int, float)) for value in values):
+        raise APIException("Invalid cursor", status_code=400)
+    return values
+
+
+def sqlite_matches(model, terms, name_only=False):
+    # FTS5 index, ranked with bm25 (lower is better)
+    name = model.__tablename__ + "_fts"
+    fts = table(name, column("rowid"), column("rank"))
+    match = " ".join('"%s"*' % term if len(term) >= SEARCH_MIN_PREFIX else '"%s"' % term for term in terms)
+    if name_only:
+        match = "name : (%s)" % match
+    return select(fts.c.rowid.label("id"), fts.c.rank.label("score")).where(literal_column(name).op("MATCH")(match))
+
+
+def postgresql_matches(model, terms, name_only=False):
+    # tsvector prefix match ranked by ts_rank, plus trigram substring match on
+    # the name; the score is negated so that lower is better, as with FTS5
+    columns = model.__table__.c
+    vector = literal_column('"%s".search_vector' % model.__tablename__)
+    # the name is the tsvector's "A" part, see migration b7e2f4a91c3d
+    weight = "A" if name_only else ""
+    words = ["%s:*%s" % (term, weight) if len(term) >= SEARCH_MIN_PREFIX else "%s:%s" % (term, weight) for term in terms]
+    query = func.to_tsquery("simple", " & ".join(word.rstrip(":") for word in words))
+    phrase = " ".join(terms)
+    # double precision, so the score survives the round trip through a cursor
+    score = -cast(func.ts_rank(vector, query) + func.similarity(func.lower(columns.name), phrase), Double)
+    return select(columns.id, score.label("score")).where(
+        or_(vector.op("@@")(query), func.lower(columns.name).contains(phrase, autoescape=True))
+    )
+
+
+def candidates(matches, model, terms):
+    """The rows to rank for `terms`: at most SEARCH_MAX_CANDIDATES, those matching in the name first.
+
+    Ranking every match of a common word or short prefix costs a score per
+    row of the table. Each of the two scans here stops after
+    SEARCH_MAX_CANDIDATES rows instead, and the name, weighted far above the
+    other fields, keeps the best matches among them. A row found by both
+    keeps its better score.
+    """
+    scans = [
+        matches(model, terms, name_only=True).limit(SEARCH_MAX_CANDIDATES).subquery(),
+        matches(model, terms).limit(SEARCH_MAX_CANDIDATES).subquery(),
+    ]
+    found = union_all(*[select(scan.c.id, scan.c.score) for scan in scans]).subquery()
+    best = (
+        select(found.c.id, func.min(found.c.score).label("score"))
+        .group_by(found.c.id)
+        .order_by(func.min(found.c.score), found.c.id)
+        .limit(SEARCH_MAX_CANDIDATES)
+    )
+    return best.subquery()
+
+
+def search_statement(model, terms, cursor, limit):
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        matches = candidates(sqlite_matches, model, terms)
+    elif dialect == "postgresql":
+        matches = candidates(postgresql_matches, model, terms)
+    else:
+        raise APIException("Search is not available on %s" % dialect, status_code=501)
+    # Keep the page's worth of ranked candidates after the cursor, best first:
+    # only those rows are then joined and read from the catalog table.
+    best = select(matches.c.id, matches.c.score)
+    if cursor is not None:
+        # results are ordered by (score, id); continue after the last one sent
+        score, id = cursor
+        best = best.where(or_(matches.c.score > score, and_(matches.c.score == score, matches.c.id > id)))
+    best = best.order_by(matches.c.score, matches.c.id).limit(limit).subquery()
+    columns = model.__table__.c
+    statement = select(*[columns[field] for field in requested_fields(model)], best.c.score).join_from(
+        best, model.__table__, columns.id == best.c.id
+    )
+    return statement.order_by(best.c.score, best.c.id)
+
+
+def encode_results(rows, limit):
+    # like encode_page(): (JSON body without the scores, next cursor or None)
+    rows = [dict(row._mapping) for row in rows]
+    cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        cursor = encode_cursor([last["score"], last["id"]])
+    return encode([without_score(row) for row in rows[:limit]]), cursor
+
+
+def search_page(model, limit):
+    statement = search_statement(model, search_terms(), search_cursor(), limit + 1)
+    return cached(
+        model.__tablename__,
+        list_key(),
+        lambda: encode_results(db.session.execute(statement), limit),
+    )
+
+
+def without_score(row):
+    return {key: value for key, value in row.items() if key != "score"}
+
+
+def search_response(model):
+    """Respond with one page of `model` rows matching ?q=, best matches first.
+
+    Like list_response() the page size comes from ?limit= and a
+    `Link: <...>; rel="next"` header points at the next page.
+    """
+    limit = page_size()
+    body, cursor = search_page(model, limit)
+    response = json_response(body)
+    if cursor is not None:
+        response.headers["Link"] = next_link(cursor, limit)
+    return response
+
+
+def search_all(models):
+    # First page of every catalog; the per-type endpoints page further
+    limit = page_size()
+    return json_response(json_object({key: search_page(model, limit)[0] for key, model in sorted(models.items())}))
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+CREATED = "2014-12-09T13:50:49.641000Z"
+ROUTES = {"character": "/people", "planet": "/planets", "vehicle": "/vehicles"}
+
+# app.py and the modules it imports read their settings at import time
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+os.environ["RATE_LIMITS"] = "{}"
+for name in ("CACHE_URL", "DATABASE_REPLICA_URLS", "RATE_LIMIT_URL"):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from flask_migrate import upgrade
+    from app import app
+    from cache import cache
+
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+    # every request and command runs in this process, which sees all the version bumps
+    cache.shared = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def runner(app):
+    return app.test_cli_runner()
+
+
+@pytest.fixture
+def catalog_item():
+    def make(model, number):
+        # a valid item: every public field set, numbers where typed copies are parsed
+        item = {field: str(number) for field in model.public_fields if field != "id"}
+        item.update(name="%s %d" % (model.__tablename__, number), created=CREATED, edited=CREATED)
+        return item
+
+    return make
+
+
+@pytest.fixture
+def create_items(client, catalog_item):
+    def create(model, count):
+        # ids of `count` new rows, created through the bulk POST route
+        response = client.post(ROUTES[model.__tablename__], json=[catalog_item(model, number) for number in range(count)])
+        assert response.status_code == 200, response.json
+        return response.json["ids"]
+
+    return create
+
+
+@pytest.fixture
+def user_id(app, client):
+    from models import db, User
+
+    email = "%s@example.com" % uuid.uuid4().hex
+    response = client.post("/users", json={"email": email, "password": "x", "is_active": True})
+    assert response.status_code == 200, response.json
+    with app.app_context():
+        return db.session.execute(db.select(User.id).where(User.email == email)).scalar()
+
+
+@pytest.fixture
+def queries(app):
+    # SQL statements sent to the primary database while the test runs
+    from models import db
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
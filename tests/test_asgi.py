@@ -0,0 +1,114 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+import pytest
+from cache import cache
+
+
+async def call(application, path, query=b"", method="GET", body=b"", headers=()):
+    # (status, headers, body) of a request sent straight to the ASGI application
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": list(headers),
+        "http_version": "1.1",
+        "client": ("127.0.0.1", 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"]), b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def get(application, path, query=b""):
+    return asyncio.run(call(application, path, query))
+
+
+@pytest.fixture
+def application(app):
+    from asgi import application
+
+    return application
+
+
+def test_async_view(application):
+    status, _, body = get(application, "/people", b"limit=2")
+    assert status == 200 and body.startswith(b"[")
+
+
+def test_blocking_cache_stays_off_the_event_loop(application, monkeypatch):
+    loop_threads, calls = set(), []
+    for name in ("get", "get_many", "set", "version", "last_modified"):
+        method = getattr(cache, name)
+
+        def record(*args, method=method):
+            calls.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(cache, name, record)
+    monkeypatch.setattr(type(cache), "blocking", True)
+
+    async def on_loop():
+        loop_threads.add(threading.get_ident())
+
+    asyncio.run(on_loop())
+    status, _, _ = get(application, "/planets", b"limit=3")
+    assert status == 200
+    assert calls and loop_threads.isdisjoint(calls)
+
+
+def test_wsgi_fallback_takes_a_body(application):
+    body = json.dumps({"email": "%s@example.com" % uuid.uuid4().hex, "password": "x", "is_active": True}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    status, _, response = asyncio.run(call(application, "/users", method="POST", body=body, headers=headers))
+    assert status == 200 and json.loads(response) == {"message": "User has been created"}
+
+
+def test_wsgi_fallback_runs_requests_concurrently(app, application, monkeypatch):
+    def slow_pool_stats():
+        time.sleep(0.5)
+        return "[]"
+
+    monkeypatch.setitem(app.view_functions, "get_pool_stats", slow_pool_stats)
+
+    async def four_at_once():
+        return await asyncio.gather(*[call(application, "/pool/stats") for _ in range(4)])
+
+    started = time.monotonic()
+    results = asyncio.run(four_at_once())
+    assert [status for status, _, _ in results] == [200] * 4
+    assert time.monotonic() - started < 1.5
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        b"limit=2",
+        b"limit=2&sort=-name&fields=name",
+        b"limit=2&sort=-diameter&fields=name",
+        b"sort=-diameter&fields=name&stream=1",
+        b"ids=1,2,999",
+        b"stream=1",
+        b"limit=1&after=WzFd",
+    ],
+)
+def test_async_lists_match_the_wsgi_ones(client, application, create_items, query):
+    from models import Planet
+
+    create_items(Planet, 3)
+    status, headers, body = get(application, "/planets", query)
+    response = client.get("/planets?" + query.decode())
+    assert status == response.status_code
+    assert body == response.data
+    assert headers.get(b"link", b"").decode() == response.headers.get("Link", "")
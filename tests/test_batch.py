@@ -0,0 +1,65 @@
+import uuid
+from sqlalchemy import event, func, select
+from models import db, Planet
+from replicas import RoutingSession
+
+
+def test_sub_requests_keep_the_client_identity(client):
+    # the same Idempotency-Key from two clients names two requests, in a batch too
+    key = uuid.uuid4().hex
+    responses = []
+    for api_key in ("client-A", "client-B"):
+        body = {"email": "%s@example.com" % uuid.uuid4().hex, "password": "x", "is_active": True}
+        requests = [{"method": "POST", "path": "/users", "body": body, "headers": {"Idempotency-Key": key}}]
+        response = client.post("/batch", json={"requests": requests}, headers={"X-API-Key": api_key})
+        responses.append(response.json["responses"][0])
+    assert [response["status"] for response in responses] == [200, 200]
+    assert "Idempotent-Replayed" not in responses[1]["headers"]
+
+
+def test_sub_requests_cannot_claim_another_identity(client):
+    key = uuid.uuid4().hex
+    body = {"email": "%s@example.com" % uuid.uuid4().hex, "password": "x", "is_active": True}
+    headers = {"Idempotency-Key": key, "X-API-Key": "client-A"}
+    assert client.post("/users", json=body, headers=headers).status_code == 200
+    # client-A's key on a sub-request of client-B's batch is still client-B's key
+    body = dict(body, email="other-" + body["email"])
+    requests = [{"method": "POST", "path": "/users", "body": body, "headers": headers}]
+    response = client.post("/batch", json={"requests": requests}, headers={"X-API-Key": "client-B"})
+    assert response.json["responses"][0]["status"] == 200
+
+
+
+def count_planets(app):
+    with app.app_context():
+        return db.session.scalar(select(func.count()).select_from(Planet))
+
+
+def test_atomic_batch_rolls_back_on_failure(app, client, catalog_item):
+    before = count_planets(app)
+    requests = [
+        {"method": "POST", "path": "/planets", "body": [catalog_item(Planet, 1)]},
+        {"method": "DELETE", "path": "/favorite/planets/0"},
+    ]
+    response = client.post("/batch", json={"atomic": True, "requests": requests})
+    assert response.json["committed"] is False
+    assert [result["status"] for result in response.json["responses"]] == [200, 404]
+    assert count_planets(app) == before
+
+
+def test_atomic_batch_commits_once(app, client, catalog_item):
+    before = count_planets(app)
+    commits = []
+    record = lambda session: commits.append(session)
+    requests = [
+        {"method": "POST", "path": "/planets", "body": [catalog_item(Planet, 1)]},
+        {"method": "POST", "path": "/planets", "body": [catalog_item(Planet, 2)]},
+    ]
+    event.listen(RoutingSession, "after_commit", record)
+    try:
+        response = client.post("/batch", json={"atomic": True, "requests": requests})
+    finally:
+        event.remove(RoutingSession, "after_commit", record)
+    assert response.json["committed"] is True
+    assert len(commits) == 1
+    assert count_planets(app) == before + 2
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import event
+import bulk
+from models import Planet
+
+
+def test_items_are_inserted_in_batches_in_order(app, client, catalog_item, monkeypatch):
+    from models import db
+
+    monkeypatch.setattr(bulk, "BULK_BATCH_SIZE", 2)
+    batches = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, clause, multiparams, params, execution_options):
+        if getattr(clause, "is_insert", False) and clause.table.name == "planet":
+            batches.append(len(multiparams) or 1)
+
+    # one execute() per batch (a single row comes as params), however the driver then sends them
+    event.listen(engine, "before_execute", record)
+    items = [dict(catalog_item(Planet, number), name="Bulk %d" % number) for number in range(5)]
+    response = client.post("/planets", json=items)
+    assert response.status_code == 200
+    ids = response.json["ids"]
+    assert ids == sorted(ids) and len(ids) == 5
+    event.remove(engine, "before_execute", record)
+    assert batches == [2, 2, 1]
+    with app.app_context():
+        rows = db.session.execute(db.select(Planet.id, Planet.name, Planet.diameter_value).where(Planet.id.in_(ids)))
+        assert sorted(rows) == [(id, "Bulk %d" % number, number) for number, id in enumerate(ids)]
+
+
+def test_invalid_items_insert_nothing(client, catalog_item, queries):
+    items = [catalog_item(Planet, 0), dict(catalog_item(Planet, 1), name=None, diameter=12), "planet"]
+    response = client.post("/planets", json=items)
+    assert response.status_code == 400
+    assert response.json["errors"] == [
+        {"index": 1, "errors": ["name is required", "diameter must be a str"]},
+        {"index": 2, "errors": ["expected an object"]},
+    ]
+    assert not [statement for statement in queries if statement.startswith("INSERT")]
+
+
+@pytest.mark.parametrize("count, status", [(0, 400), (4, 413)])
+def test_item_count_is_bounded(client, catalog_item, monkeypatch, count, status):
+    monkeypatch.setattr(bulk, "BULK_MAX_ITEMS", 3)
+    response = client.post("/planets", json=[catalog_item(Planet, number) for number in range(count)])
+    assert response.status_code == status
@@ -0,0 +1,138 @@
+import time
+import fakeredis
+import pytest
+import cache
+from cache import MISSING, MemoryBackend, RedisBackend, cached, versioned_key
+
+
+def test_memory_backend_evicts_the_least_recently_used():
+    backend = MemoryBackend(max_entries=2, ttl=60)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    assert backend.get("a") == 1
+    backend.set("c", 3)
+    assert [backend.get(key) for key in "abc"] == [1, MISSING, 3]
+
+
+def test_memory_backend_entries_expire(monkeypatch):
+    backend = MemoryBackend(max_entries=10, ttl=60)
+    backend.set("a", 1)
+    backend.set("b", 2, ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert [backend.get("a"), backend.get("b")] == [1, MISSING]
+
+
+def test_reads_are_cached_until_the_table_changes(client, create_items, queries):
+    from models import Character
+
+    id = create_items(Character, 1)[0]
+    assert client.get("/people/%d" % id).status_code == 200
+    del queries[:]
+    hits = cache.cache.hits
+    assert client.get("/people/%d" % id).status_code == 200
+    assert queries == []
+    assert cache.cache.hits == hits + 1
+    # any committed write to the table invalidates its entries
+    version = cache.cache.version("character")
+    create_items(Character, 1)
+    assert cache.cache.version("character") == version + 1
+    del queries[:]
+    assert client.get("/people/%d" % id).status_code == 200
+    assert len(queries) == 1
+
+
+def test_rolled_back_writes_keep_the_cache(app, catalog_item):
+    from models import Character, db
+
+    version = cache.cache.version("character")
+    with app.app_context():
+        db.session.add(Character(**catalog_item(Character, 0)))
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+    assert cache.cache.version("character") == version
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def redis_backend(server):
+    # one backend per worker process, all of them talking to the same server
+    return RedisBackend(fakeredis.FakeRedis(server=server), ttl=60)
+
+
+def test_entries_and_counters(server):
+    backend = redis_backend(server)
+    assert backend.get("a") is MISSING
+    backend.set("a", {"id": 1})
+    assert backend.get("a") == {"id": 1}
+    assert backend.get_many(["a", "b"]) == [{"id": 1}, MISSING]
+    assert backend.get_many([]) == []
+    assert (backend.hits, backend.misses) == (2, 2)
+
+
+def test_entries_expire_with_the_ttl(server):
+    backend = redis_backend(server)
+    backend.set("a", 1)
+    backend.set("b", 2, ttl=5)
+    assert 0 < backend.client.ttl("cache:a") <= 60
+    assert 0 < backend.client.ttl("cache:b") <= 5
+
+
+def test_settings_are_not_entries(server):
+    backend = redis_backend(server)
+    backend.set_setting("profiling", {"slow_query_ms": 10}, ttl=60)
+    assert backend.get_setting("profiling") == {"slow_query_ms": 10}
+    assert backend.get("setting:profiling") is not MISSING
+    assert (backend.hits, backend.misses) == (1, 0)
+    backend.set_setting("profiling", None, ttl=60)
+    assert backend.get_setting("profiling") is None
+
+
+def test_bump_version_changes_the_keys(server, monkeypatch):
+    backend = redis_backend(server)
+    monkeypatch.setattr(cache, "cache", backend)
+    version = backend.version("planet")
+    modified = backend.last_modified("planet")
+    key = versioned_key("planet", ["entity", 1])
+    assert key.startswith("planet:%d:" % version)
+    backend.bump_version("planet")
+    assert backend.version("planet") == version + 1
+    assert backend.last_modified("planet") >= modified
+    assert versioned_key("planet", ["entity", 1]) != key
+
+
+def test_workers_share_entries_and_invalidations(server, monkeypatch):
+    first, second = redis_backend(server), redis_backend(server)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return len(loads)
+
+    def read(backend):
+        monkeypatch.setattr(cache, "cache", backend)
+        return cached("planet", ["list", "/planets"], load)
+
+    assert read(first) == 1
+    # filled by the first worker
+    assert read(second) == 1
+    # a commit in the second worker bumps the version for everybody
+    second.bump_version("planet")
+    assert first.version("planet") == second.version("planet")
+    assert read(first) == 2
+    assert read(second) == 2
+    assert len(loads) == 2
+
+
+def test_clear_only_removes_its_prefix(server):
+    backend = redis_backend(server)
+    other = RedisBackend(backend.client, ttl=60, prefix="other:")
+    backend.set("a", 1)
+    other.set("a", 2)
+    backend.clear()
+    assert backend.get("a") is MISSING
+    assert other.get("a") == 2
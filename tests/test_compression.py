@@ -0,0 +1,26 @@
+import compression
+from cache import cache
+from models import Planet
+
+
+def test_compressed_once_with_the_default_cache(client, create_items, monkeypatch):
+    monkeypatch.delattr(cache, "shared")
+    create_items(Planet, 30)
+    calls = []
+    gzip = compression.ENCODINGS["gzip"]
+    monkeypatch.setitem(compression.ENCODINGS, "gzip", lambda body: calls.append(body) or gzip(body))
+    headers = {"Accept-Encoding": "gzip"}
+    first = client.get("/planets?limit=30&sort=-id", headers=headers)
+    again = client.get("/planets?limit=30&sort=-id", headers=headers)
+    assert first.headers["Content-Encoding"] == again.headers["Content-Encoding"] == "gzip"
+    assert first.data == again.data
+    assert len(calls) == 1
+    assert first.headers["ETag"].endswith('-gzip"')
+    revalidated = client.get("/planets?limit=30&sort=-id", headers=dict(headers, **{"If-None-Match": first.headers["ETag"]}))
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == first.headers["ETag"]
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = client.get("/planets?limit=1&fields=id", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
@@ -0,0 +1,57 @@
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from flask import Flask
+from encoding import OrjsonProvider, StdlibJSONProvider, encode, json_array, json_object
+
+pytest.importorskip("orjson")
+
+DOCUMENTS = [
+    {"b": 1, "a": [1.5, None, True], "é": "ünïcode ✓"},
+    {"created": datetime(2014, 12, 9, 13, 50, 51), "day": date(2014, 12, 9)},
+    {"price": Decimal("10.50"), "id": uuid.UUID(int=1)},
+    [{"z": {"y": 1, "x": 2}}],
+]
+
+
+@pytest.fixture
+def providers():
+    # providers only keep a weak reference to their app
+    app = Flask(__name__)
+    yield StdlibJSONProvider(app), OrjsonProvider(app)
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_orjson_matches_the_standard_library(providers, document):
+    stdlib, fast = providers
+    # orjson always writes UTF-8 where the standard library escapes non-ASCII characters
+    stdlib.ensure_ascii = False
+    assert fast.encode(document) == stdlib.encode(document)
+    assert fast.loads(fast.dumps(document)) == stdlib.loads(stdlib.dumps(document))
+
+
+def test_json_options_fall_back_to_the_standard_library(providers):
+    _, fast = providers
+    assert fast.dumps({"a": 1}, indent=2) == '{\n  "a": 1\n}'
+    assert fast.loads("[1.5]", parse_float=Decimal) == [Decimal("1.5")]
+
+
+def test_responses_are_indented_in_debug_mode(providers):
+    stdlib, fast = providers
+    with fast._app.test_request_context():
+        assert fast.response({"b": 1, "a": 2}).data == b'{"a":2,"b":1}\n'
+        fast._app.debug = True
+        assert fast.response(a=1).data == stdlib.response(a=1).data == b'{\n  "a": 1\n}\n'
+
+
+def test_pre_encoded_fragments(app):
+    with app.app_context():
+        body = json_object({"results": json_array([encode({"id": 1}), encode({"id": 2})]), "missing": encode([])})
+    assert json.loads(body) == {"results": [{"id": 1}, {"id": 2}], "missing": []}
+    assert json_array([]) == b"[]"
+
+
+def test_app_uses_the_configured_encoder(app):
+    assert isinstance(app.json, OrjsonProvider)
@@ -0,0 +1,32 @@
+from models import Character, Planet
+
+
+def test_expanded_favorites_take_one_query_per_kind(client, create_items, user_id, queries):
+    characters = create_items(Character, 3)
+    (planet,) = create_items(Planet, 1)
+    for id in characters:
+        assert client.post("/favorite/people", json={"user_id": user_id, "character_id": id}).status_code == 200
+    assert client.post("/favorite/planets", json={"user_id": user_id, "planet_id": planet}).status_code == 200
+    del queries[:]
+    response = client.get("/users/%d/favorites?expand=1" % user_id)
+    assert response.status_code == 200
+    people = response.json["people"]
+    assert [favorite["character_id"] for favorite in people] == characters
+    assert [favorite["character"]["name"] for favorite in people] == ["character 0", "character 1", "character 2"]
+    assert response.json["planets"][0]["planet"]["id"] == planet
+    assert response.json["vehicles"] == []
+    favorite_queries = [statement for statement in queries if "FROM favorite_" in statement]
+    assert len(favorite_queries) == 3
+    assert all(" JOIN " in statement for statement in favorite_queries)
+
+
+def test_favorites_are_not_expanded_by_default(client, create_items, user_id):
+    (id,) = create_items(Character, 1)
+    client.post("/favorite/people", json={"user_id": user_id, "character_id": id})
+    people = client.get("/users/%d/favorites" % user_id).json["people"]
+    assert [favorite["character_id"] for favorite in people] == [id]
+    assert "character" not in people[0]
+
+
+def test_favorites_of_a_missing_user(client):
+    assert client.get("/users/999999/favorites?expand=1").status_code == 404
@@ -0,0 +1,23 @@
+import uuid
+
+
+def create_user(client, email, headers):
+    return client.post("/users", json={"email": email, "password": "x", "is_active": True}, headers=headers)
+
+
+def test_replay(client):
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    email = "%s@example.com" % uuid.uuid4().hex
+    first = create_user(client, email, headers)
+    again = create_user(client, email, headers)
+    assert first.status_code == again.status_code == 200
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert create_user(client, "other-" + email, headers).status_code == 422
+
+
+def test_keys_are_scoped_to_the_client(client):
+    key = uuid.uuid4().hex
+    alice = create_user(client, "%s@example.com" % uuid.uuid4().hex, {"Idempotency-Key": key, "X-API-Key": "alice"})
+    bob = create_user(client, "%s@example.com" % uuid.uuid4().hex, {"Idempotency-Key": key, "X-API-Key": "bob"})
+    assert alice.status_code == bob.status_code == 200
+    assert "Idempotent-Replayed" not in bob.headers
@@ -0,0 +1,35 @@
+import json
+import pytest
+from sqlalchemy import func, select
+from importer import CATALOGS, import_catalog
+from models import db
+
+
+def count(model):
+    return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+
+@pytest.mark.parametrize("kind", sorted(CATALOGS))
+def test_import_ndjson(app, runner, catalog_item, tmp_path, kind):
+    model = CATALOGS[kind]
+    source = tmp_path / ("%s.ndjson" % kind)
+    source.write_text("\n".join(json.dumps(catalog_item(model, number)) for number in range(3)))
+    with app.app_context():
+        before = count(model)
+        result = runner.invoke(import_catalog, [kind, str(source)])
+        assert result.exit_code == 0, result.output
+        assert "Imported 3 %s rows" % kind in result.output
+        assert count(model) == before + 3
+
+
+def test_import_rejects_invalid_rows(app, runner, catalog_item, tmp_path):
+    model = CATALOGS["planet"]
+    source = tmp_path / "planet.ndjson"
+    items = [catalog_item(model, 1), {"name": "no other field"}]
+    source.write_text("\n".join(json.dumps(item) for item in items))
+    with app.app_context():
+        before = count(model)
+        result = runner.invoke(import_catalog, ["planet", str(source)])
+        assert result.exit_code != 0
+        assert "Row 2" in result.output
+        assert count(model) == before
@@ -0,0 +1,109 @@
+import json
+import pytest
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "abc", "²", "1.5"])
+def test_invalid_page_size_is_a_bad_request(client, limit):
+    response = client.get("/people", query_string={"limit": limit})
+    assert response.status_code == 400
+    assert response.json["message"] == "limit must be a positive integer"
+
+
+@pytest.mark.parametrize("ids", ["", "1,,2", "1,x", "1,²", "1.5"])
+def test_invalid_batch_ids_are_a_bad_request(client, ids):
+    response = client.get("/people", query_string={"ids": ids})
+    assert response.status_code == 400
+    assert response.json["message"] == "ids must be a comma separated list of integers"
+
+
+def test_batch_ids_keep_their_order(client, create_items):
+    from models import Character
+
+    first, _, third = create_items(Character, 3)
+    response = client.get("/people", query_string={"ids": "%d, %d,%d,999" % (third, first, third), "fields": "id"})
+    assert response.json == {"results": [{"id": third}, {"id": first}], "missing": [999]}
+
+
+def next_path(response):
+    link = response.headers.get("Link")
+    return link[link.index("<") + 1:link.index(">")] if link else None
+
+
+def test_sort_fields_left_out_of_fields_are_not_returned(client, catalog_item):
+    from models import Planet
+
+    items = []
+    for number in range(5):
+        item = catalog_item(Planet, number)
+        item.update(name="Planet %d" % number, diameter=str(1000 * (5 - number)), climate="listed")
+        items.append(item)
+    assert client.post("/planets", json=items).status_code == 200
+    names, path = [], "/planets?climate=listed&fields=name&sort=diameter&limit=2"
+    while path:
+        response = client.get(path)
+        assert all(set(row) == {"id", "name"} for row in response.json)
+        names.extend(row["name"] for row in response.json)
+        path = next_path(response)
+    assert names == ["Planet %d" % number for number in reversed(range(5))]
+    lines = client.get("/planets?climate=listed&fields=name&sort=diameter&stream=1").data.splitlines()
+    assert [json.loads(line)["name"] for line in lines] == names
+    assert all(set(json.loads(line)) == {"id", "name"} for line in lines)
+
+
+@pytest.mark.parametrize("values", [[True], [1.5], ["1"], [None]])
+def test_cursor_values_must_match_the_sort_fields(client, values):
+    from listing import encode_cursor
+
+    response = client.get("/people", query_string={"after": encode_cursor(values)})
+    assert response.status_code == 400
+    assert response.json["message"] == "Invalid cursor"
+
+
+def test_stream_returns_every_row_as_ndjson(client, catalog_item, monkeypatch):
+    import listing
+    from models import Vehicle
+
+    monkeypatch.setattr(listing, "STREAM_CHUNK_SIZE", 2)
+    items = []
+    for number in range(5):
+        item = catalog_item(Vehicle, number)
+        item.update(name="Streamed %d" % number, model="streamed")
+        items.append(item)
+    ids = client.post("/vehicles", json=items).json["ids"]
+    response = client.get("/vehicles?model=streamed&fields=name&stream=1", buffered=False)
+    # flushed STREAM_CHUNK_SIZE rows at a time
+    chunks = list(response.response)
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+    response.close()
+    assert response.mimetype == "application/x-ndjson"
+    assert "Link" not in response.headers
+    rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert rows == [{"id": id, "name": "Streamed %d" % number} for number, id in enumerate(ids)]
+    negotiated = client.get("/vehicles?model=streamed&fields=name", headers={"Accept": "application/x-ndjson"})
+    assert negotiated.mimetype == "application/x-ndjson"
+    assert negotiated.data == b"".join(chunks)
+    assert client.get("/vehicles?model=streamed", headers={"Accept": "application/json"}).mimetype == "application/json"
+
+
+def test_projected_rows_match_the_serialized_entities(app, client, create_items):
+    from models import Character, db
+
+    id = create_items(Character, 1)[0]
+    with app.app_context():
+        entity = db.session.get(Character, id).serialize()
+    assert client.get("/people/%d" % id).json == entity
+    assert client.get("/people", query_string={"ids": str(id)}).json["results"] == [entity]
+    assert client.get("/people", query_string={"sort": "-id", "limit": 1}).json == [entity]
+
+
+def test_fields_project_every_read_path(client, create_items):
+    from models import Character
+
+    id = create_items(Character, 1)[0]
+    expected = {"id": id, "name": "character 0", "gender": "0"}
+    assert client.get("/people/%d?fields=name,gender" % id).json == expected
+    assert client.get("/people?ids=%d&fields=gender,name" % id).json["results"] == [expected]
+    assert client.get("/people?sort=-id&limit=1&fields=name,gender,id").json == [expected]
+    response = client.get("/people/%d?fields=name,password" % id)
+    assert response.status_code == 400
+    assert response.json["message"] == "Unknown fields: password"
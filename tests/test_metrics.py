@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def test_failed_statements_do_not_leak_timers(app):
+    from models import db
+
+    with app.app_context():
+        connection = db.session.connection()
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM no_such_table"))
+            db.session.rollback()
+            connection = db.session.connection()
+        connection.execute(text("SELECT 1"))
+        assert connection.info.get("query_start") == []
+
+
+def sample(name, **labels):
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_counted_per_route(client, create_items):
+    from models import Planet
+
+    id = create_items(Planet, 1)[0]
+    client.get("/planets/%d" % id)
+    requests = sample("http_requests_total", endpoint="get_planet", method="GET", status="200")
+    latency = sample("http_request_duration_seconds_count", endpoint="get_planet")
+    sizes = sample("http_response_size_bytes_count", endpoint="get_planet")
+    queries = sample("http_db_queries_total", endpoint="get_planet")
+    # a new version of the table, so the entity is read again
+    create_items(Planet, 1)
+    assert client.get("/planets/%d" % id).status_code == 200
+    assert sample("http_requests_total", endpoint="get_planet", method="GET", status="200") == requests + 1
+    assert sample("http_request_duration_seconds_count", endpoint="get_planet") == latency + 1
+    assert sample("http_response_size_bytes_count", endpoint="get_planet") == sizes + 1
+    assert sample("http_db_queries_total", endpoint="get_planet") == queries + 1
+
+
+def test_unmatched_urls_share_a_label(client):
+    before = sample("http_requests_total", endpoint="unmatched", method="GET", status="404")
+    client.get("/no/such/page/1")
+    client.get("/no/such/page/2")
+    assert sample("http_requests_total", endpoint="unmatched", method="GET", status="404") == before + 2
+
+
+def test_exposition(client):
+    client.get("/planets?limit=1")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert b'http_requests_total{endpoint="get_planets",method="GET",status="200"}' in response.data
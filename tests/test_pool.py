@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError
+from pool import InstrumentedQueuePool, engine_options, instrument_pool, pool_stats
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        "sqlite:///%s" % (tmp_path / "pool.db"),
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2,
+    )
+    yield engine
+    engine.dispose()
+    pool_stats.pop("test", None)
+
+
+def test_engine_options_from_the_environment(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "5")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "2.5")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+    monkeypatch.delenv("DB_MAX_OVERFLOW", raising=False)
+    options = engine_options("postgresql://primary/example")
+    assert options == {"pool_size": 5, "pool_timeout": 2.5, "pool_pre_ping": True, "poolclass": InstrumentedQueuePool}
+    assert "poolclass" not in engine_options("sqlite://")
+
+
+def test_checkouts_and_waits_are_counted(engine):
+    stats = instrument_pool(engine, "test")
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    snapshot = stats.snapshot()
+    assert (snapshot["connects"], snapshot["checkouts"], snapshot["checkins"]) == (1, 3, 3)
+    assert (snapshot["size"], snapshot["checked_out"], snapshot["checked_in"]) == (1, 0, 1)
+    assert snapshot["wait_seconds"]["count"] == 3
+    assert snapshot["wait_seconds"]["buckets"]["+Inf"] == 3
+
+
+def test_timeouts_and_current_wait(engine):
+    stats = instrument_pool(engine, "test")
+    held = engine.connect()
+
+    def wait():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.1)
+    waited = stats.current_wait()
+    waiter.join()
+    held.close()
+    assert 0.05 < waited < 0.2
+    assert stats.current_wait() == 0.0
+    snapshot = stats.snapshot()
+    assert snapshot["timeouts"] == 1
+    # the timed out checkout waited at least pool_timeout
+    assert snapshot["wait_seconds"]["buckets"]["0.1"] == 1
+    assert snapshot["wait_seconds"]["buckets"]["0.25"] == 2
+
+
+def test_stats_endpoint(client):
+    response = client.get("/pool/stats")
+    assert response.status_code == 200
+    assert "primary" in [pool["name"] for pool in response.json]
@@ -0,0 +1,70 @@
+from models import Character, Planet
+
+
+def favorite(client, user_id, character_id):
+    response = client.post("/favorite/people", json={"user_id": user_id, "character_id": character_id})
+    assert response.status_code == 200, response.json
+
+
+def top_counts(client, path="/people/top?limit=100"):
+    return {row["id"]: row["favorite_count"] for row in client.get(path).json}
+
+
+def test_top_counts_favorites(client, create_items, user_id):
+    first, second = create_items(Character, 2)
+    favorite(client, user_id, first)
+    favorite(client, user_id, first)  # repeated: counted once
+    favorite(client, user_id, second)
+    counts = top_counts(client)
+    assert counts[first] == 1 and counts[second] == 1
+
+
+def test_favorite_writes_keep_catalog_etags(client, create_items, user_id):
+    (id,) = create_items(Character, 1)
+    etag = client.get("/people?limit=5").headers["ETag"]
+    entity_etag = client.get("/people/%d" % id).headers["ETag"]
+    top_etag = client.get("/people/top").headers["ETag"]
+    favorite(client, user_id, id)
+    assert client.get("/people?limit=5", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/people/%d" % id, headers={"If-None-Match": entity_etag}).status_code == 304
+    assert client.get("/people/top", headers={"If-None-Match": top_etag}).status_code == 200
+
+
+def test_reconcile_repairs_counters(app, client, runner, create_items, user_id):
+    from models import db, PlanetFavoriteCount
+
+    (id,) = create_items(Planet, 1)
+    client.post("/favorite/planets", json={"user_id": user_id, "planet_id": id})
+    with app.app_context():
+        db.session.execute(db.delete(PlanetFavoriteCount).where(PlanetFavoriteCount.planet_id == id))
+        db.session.commit()
+    assert id not in top_counts(client, "/planets/top?limit=100")
+    result = runner.invoke(args=["reconcile-favorites"])
+    assert result.exit_code == 0, result.output
+    assert top_counts(client, "/planets/top?limit=100")[id] == 1
+
+
+def test_remove_favorite_uncounts_it_once(app, client, create_items, user_id):
+    from models import db, FavoriteCharacter
+
+    (id,) = create_items(Character, 1)
+    favorite(client, user_id, id)
+    with app.app_context():
+        favorite_id = db.session.scalar(db.select(FavoriteCharacter.id).where(FavoriteCharacter.character_id == id))
+    assert top_counts(client)[id] == 1
+    assert client.delete("/favorite/people/%d" % favorite_id).status_code == 200
+    assert id not in top_counts(client)
+    assert client.delete("/favorite/people/%d" % favorite_id).status_code == 404
+
+
+def test_remove_favorite_without_entity(app, client, user_id):
+    from models import db, FavoriteCharacter
+
+    with app.app_context():
+        orphan = FavoriteCharacter(user_id=user_id, character_id=None)
+        db.session.add(orphan)
+        db.session.commit()
+        favorite_id = orphan.id
+    assert client.delete("/favorite/people/%d" % favorite_id).status_code == 200
+    with app.app_context():
+        assert db.session.get(FavoriteCharacter, favorite_id) is None
@@ -0,0 +1,53 @@
+import time
+import pytest
+import profiling
+from cache import cache
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "secret")
+    yield {"Authorization": "Bearer secret"}
+    cache.set_setting(profiling.STATE_KEY, None, ttl=None)
+    profiling._state["read_at"] = 0.0
+
+
+def test_disabled_without_token(client):
+    assert client.put("/profiling", json={"enabled": True}).status_code == 403
+    response = client.get("/people?limit=1", headers={"X-Profile": "1"})
+    assert "Server-Timing" not in response.headers
+
+
+def test_wrong_token(client, token):
+    response = client.put("/profiling", json={"enabled": True}, headers={"Authorization": "Bearer nope"})
+    assert response.status_code == 401
+    assert "Server-Timing" not in client.get("/people?limit=1", headers={"X-Profile": "1"}).headers
+
+
+def test_single_request_with_token(client, token):
+    response = client.get("/people?limit=1", headers=dict(token, **{"X-Profile": "1"}))
+    assert "Server-Timing" in response.headers
+
+
+def test_switch_is_capped_and_not_counted(client, token, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_MAX_DURATION", 60)
+    response = client.put("/profiling", json={"enabled": True, "duration": 10 ** 9}, headers=token)
+    assert response.status_code == 200
+    expires, _ = cache._settings[profiling.STATE_KEY]
+    assert expires - time.monotonic() <= 60
+    misses = cache.misses
+    for _ in range(3):
+        profiling._state["read_at"] = 0.0
+        assert profiling.profiling_state() is not None
+    assert cache.misses == misses
+    assert "Server-Timing" in client.get("/people?limit=1").headers
+    assert client.put("/profiling", json={"enabled": False}, headers=token).status_code == 200
+    assert "Server-Timing" not in client.get("/people?limit=1").headers
+
+
+def test_switch_tells_whether_it_reaches_every_worker(client, token, monkeypatch):
+    assert client.put("/profiling", json={"enabled": True}, headers=token).json["shared"] is True
+    monkeypatch.delattr(cache, "shared")
+    response = client.get("/profiling")
+    assert response.json["enabled"] is True
+    assert response.json["shared"] is False
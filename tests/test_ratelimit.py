@@ -0,0 +1,90 @@
+import pytest
+import ratelimit
+from models import Character
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(value):
+        monkeypatch.setattr(ratelimit, "RATE_LIMITS", value)
+        monkeypatch.setattr(ratelimit, "buckets", ratelimit.MemoryBuckets(100))
+
+    return set_limits
+
+
+def test_over_budget_gets_429(client, limits):
+    limits({"default": [1, 2]})
+    statuses = [client.get("/people?limit=1").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert client.get("/people?limit=1").headers["Retry-After"] == "1"
+
+
+def test_batch_sub_requests_are_charged(client, create_items, user_id, limits):
+    ids = create_items(Character, 3)
+    limits({"write": [1, 3]})
+    requests = [
+        {"method": "POST", "path": "/favorite/people", "body": {"user_id": user_id, "character_id": id}} for id in ids
+    ]
+    response = client.post("/batch", json={"requests": requests})
+    # the batch itself takes one token, leaving two for its sub-requests
+    assert [result["status"] for result in response.json["responses"]] == [200, 200, 429]
+    assert client.post("/favorite/people", json={"user_id": user_id, "character_id": ids[0]}).status_code == 429
+
+
+def test_batch_counts_in_flight_until_done(client, limits, monkeypatch):
+    import batch
+
+    limits({})
+    seen = []
+    dispatch = batch.dispatch
+
+    def recording_dispatch(item):
+        response = dispatch(item)
+        seen.append(ratelimit.in_flight)
+        return response
+
+    monkeypatch.setattr(batch, "dispatch", recording_dispatch)
+    client.post("/batch", json={"requests": [{"path": "/people?limit=1"}, {"path": "/planets?limit=1"}]})
+    assert seen == [1, 1]
+    assert ratelimit.in_flight == 0
+
+
+def test_shed_when_too_many_requests_are_in_flight(client, limits, monkeypatch):
+    limits({})
+    monkeypatch.setattr(ratelimit, "SHED_MAX_IN_FLIGHT", 2)
+    monkeypatch.setattr(ratelimit, "SHED_RETRY_AFTER", 3)
+    monkeypatch.setattr(ratelimit, "in_flight", 2)
+    response = client.get("/people?limit=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert ratelimit.in_flight == 2
+    monkeypatch.setattr(ratelimit, "in_flight", 1)
+    assert client.get("/people?limit=1").status_code == 200
+    assert ratelimit.in_flight == 1
+
+
+def test_shed_when_the_pool_queue_is_too_long(client, limits, monkeypatch):
+    limits({})
+    monkeypatch.setattr(ratelimit, "SHED_MAX_POOL_WAIT_MS", 100)
+    monkeypatch.setattr(ratelimit, "pool_wait_ms", lambda: 250)
+    response = client.get("/people?limit=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # metrics stay reachable on an overloaded server
+    assert client.get("/metrics").status_code == 200
+
+
+def test_retry_after_rounds_up(client, limits):
+    limits({"default": [0.25, 1]})
+    assert client.get("/people?limit=1").status_code == 200
+    response = client.get("/people?limit=1")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "4"
+
+
+def test_clients_have_separate_buckets(client, limits):
+    limits({"default": [1, 1]})
+    assert client.get("/people?limit=1", headers={"X-API-Key": "a"}).status_code == 200
+    assert client.get("/people?limit=1", headers={"X-API-Key": "a"}).status_code == 429
+    assert client.get("/people?limit=1", headers={"X-API-Key": "b"}).status_code == 200
+    assert client.get("/people?limit=1").status_code == 200
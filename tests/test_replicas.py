@@ -0,0 +1,98 @@
+import shutil
+import sqlite3
+import threading
+import time
+import pytest
+from sqlalchemy import select
+import replicas as replicas_module
+from replicas import READ_PRIMARY_COOKIE, REPLICA_MAX_LAG, ReplicaSet, probe_connect_args
+
+
+def test_probe_does_not_block_choose(monkeypatch):
+    replicas = ReplicaSet()
+    replica = replicas.add("sqlite://")
+    assert replicas.choose() is replica
+    replica.down_until = time.monotonic() - 1  # down, due for a retry
+    release = threading.Event()
+    connect = replica.probe_engine.connect
+
+    def hanging_connect():
+        release.wait(5)
+        return connect()
+
+    monkeypatch.setattr(replica.probe_engine, "connect", hanging_connect)
+    started = time.monotonic()
+    assert [replicas.choose() for _ in range(3)] == [None, None, None]
+    assert time.monotonic() - started < 1
+    release.set()
+    for _ in range(50):
+        if replica.down_until == 0.0:
+            break
+        time.sleep(0.05)
+    assert replicas.choose() is replica
+
+
+def test_probe_connect_timeout():
+    assert probe_connect_args("postgresql://replica/example") == {"connect_timeout": 2}
+    assert probe_connect_args("sqlite://") == {}
+
+
+@pytest.fixture
+def replica(app, client, catalog_item, monkeypatch, tmp_path):
+    # a copy of the test database whose planet names differ from the primary's
+    from conftest import DB_PATH
+    from models import Planet
+
+    response = client.post("/planets", json=[catalog_item(Planet, 0)])
+    id = response.json["ids"][0]
+    path = str(tmp_path / "replica.db")
+    shutil.copy(DB_PATH, path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE planet SET name = 'on the replica'")
+    replicas = ReplicaSet()
+    replicas.add("sqlite:///" + path)
+    monkeypatch.setattr(replicas_module, "replica_set", replicas)
+    return id
+
+
+def read_name(app, id, *args, **kwargs):
+    from models import Planet, db
+
+    with app.test_request_context(*args, **kwargs):
+        return db.session.scalar(select(Planet.name).where(Planet.id == id))
+
+
+def test_reads_go_to_the_replica(app, replica):
+    assert read_name(app, replica, "/planets") == "on the replica"
+    assert read_name(app, replica, "/planets", method="HEAD") == "on the replica"
+
+
+def test_writes_and_forced_reads_go_to_the_primary(app, replica):
+    assert read_name(app, replica, "/planets", method="POST") != "on the replica"
+    assert read_name(app, replica, "/planets", headers={"X-Read-Primary": "1"}) != "on the replica"
+
+
+def test_reads_after_a_write_stay_on_the_primary(app, replica):
+    from models import Planet, db
+
+    with app.test_request_context("/planets"):
+        planet = db.session.get(Planet, replica)
+        planet.name = "renamed"
+        db.session.flush()
+        assert db.session.scalar(select(Planet.name).where(Planet.id == replica)) == "renamed"
+        db.session.rollback()
+
+
+def test_clients_read_their_writes_for_the_lag_window(app, client, catalog_item, replica, monkeypatch):
+    from models import Planet
+
+    response = client.post("/planets", json=[dict(catalog_item(Planet, 1), name="written")])
+    id = response.json["ids"][0]
+    cookie = client.get_cookie(READ_PRIMARY_COOKIE)
+    until = float(cookie.value)
+    assert time.time() < until <= time.time() + REPLICA_MAX_LAG
+    headers = {"Cookie": "%s=%s" % (READ_PRIMARY_COOKIE, cookie.value)}
+    assert read_name(app, id, "/planets", headers=headers) == "written"
+    # not on the replica yet
+    monkeypatch.setattr(time, "time", lambda: until + 1)
+    assert read_name(app, id, "/planets", headers=headers) is None
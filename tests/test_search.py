@@ -0,0 +1,58 @@
+from models import Character
+
+
+def test_best_match_wins_over_many_weaker_ones(client, catalog_item):
+    items = []
+    for number in range(600):
+        item = catalog_item(Character, number)
+        item.update(name="Filler %d" % number, homeworld="Skyland")
+        items.append(item)
+    best = catalog_item(Character, 600)
+    best.update(name="Skywalker", homeworld="Tatooine")
+    assert client.post("/people", json=items + [best]).status_code == 200
+    response = client.get("/people/search?q=sky&limit=5&fields=name")
+    assert response.json[0]["name"] == "Skywalker"
+
+
+def test_paging_reaches_every_match(client, catalog_item):
+    items = []
+    for number in range(250):
+        item = catalog_item(Character, number)
+        item.update(homeworld="Cloudcity")
+        items.append(item)
+    assert client.post("/people", json=items).status_code == 200
+    ids, path = [], "/people/search?q=cloudcity&limit=100&fields=id"
+    while path:
+        response = client.get(path)
+        ids.extend(row["id"] for row in response.json)
+        link = response.headers.get("Link")
+        path = link[link.index("<") + 1:link.index(">")] if link else None
+    assert len(ids) == len(set(ids)) == 250
+
+
+def test_name_matches_are_ranked_first_past_the_candidate_cap(client, catalog_item, monkeypatch):
+    import search
+
+    monkeypatch.setattr(search, "SEARCH_MAX_CANDIDATES", 50)
+    items = []
+    for number in range(200):
+        item = catalog_item(Character, number)
+        item.update(name="Filler %d" % number, homeworld="Skyland")
+        items.append(item)
+    best = catalog_item(Character, 200)
+    best.update(name="Skywalker", homeworld="Tatooine")
+    assert client.post("/people", json=items + [best]).status_code == 200
+    response = client.get("/people/search?q=sky&limit=5&fields=name")
+    assert response.json[0]["name"] == "Skywalker"
+    assert len(client.get("/people/search?q=sky&limit=100&fields=id").json) == 50
+
+
+def test_short_words_are_matched_whole(client, catalog_item):
+    items = []
+    for number, name in enumerate(("R2 D2", "Rey", "Raymus")):
+        item = catalog_item(Character, number)
+        item.update(name=name)
+        items.append(item)
+    assert client.post("/people", json=items).status_code == 200
+    assert [row["name"] for row in client.get("/people/search?q=r&fields=name").json] == []
+    assert {row["name"] for row in client.get("/people/search?q=ra&fields=name").json} == {"Raymus"}
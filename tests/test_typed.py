@@ -0,0 +1,73 @@
+import uuid
+from datetime import datetime
+import pytest
+from models import Planet, parse_number, parse_timestamp
+
+
+@pytest.mark.parametrize(
+    "value, number",
+    [("1,358", 1358.0), (" 12.5 ", 12.5), ("1e9", 1e9), ("unknown", None), ("30-165", None), ("inf", None)],
+)
+def test_parse_number(value, number):
+    assert parse_number(value) == number
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("2014-12-09T13:50:51.644000Z") == datetime(2014, 12, 9, 13, 50, 51, 644000)
+    assert parse_timestamp("2014-12-09T15:50:51+02:00") == datetime(2014, 12, 9, 13, 50, 51)
+    assert parse_timestamp("2014-12-09") == datetime(2014, 12, 9)
+    assert parse_timestamp("yesterday") is None
+
+
+@pytest.fixture
+def planets(client, catalog_item):
+    # diameters as the catalog has them: thousands separators and unknown values
+    terrain = uuid.uuid4().hex
+    items = []
+    for number, diameter in enumerate(("10,465", "7200", "unknown", "118000", "900")):
+        item = catalog_item(Planet, number)
+        item.update(diameter=diameter, terrain=terrain, edited="2015-0%d-01T00:00:00Z" % (number + 1))
+        items.append(item)
+    assert client.post("/planets", json=items).status_code == 200
+    return terrain
+
+
+def diameters(client, planets, query):
+    response = client.get("/planets?terrain=%s&fields=diameter&%s" % (planets, query))
+    assert response.status_code == 200, response.json
+    return [row["diameter"] for row in response.json]
+
+
+def test_sorts_are_numeric_with_unparsed_values_last(client, planets):
+    assert diameters(client, planets, "sort=diameter") == ["900", "7200", "10,465", "118000", "unknown"]
+    assert diameters(client, planets, "sort=-diameter") == ["118000", "10,465", "7200", "900", "unknown"]
+
+
+def test_sorted_pages_resume_from_the_cursor(client, planets):
+    seen, path = [], "/planets?terrain=%s&fields=diameter&sort=-diameter&limit=2" % planets
+    while path:
+        response = client.get(path)
+        seen.extend(row["diameter"] for row in response.json)
+        link = response.headers.get("Link")
+        path = link[link.index("<") + 1:link.index(">")] if link else None
+    assert seen == ["118000", "10,465", "7200", "900", "unknown"]
+
+
+def test_range_filters(client, planets):
+    assert diameters(client, planets, "diameter_gte=7200&sort=diameter") == ["7200", "10,465", "118000"]
+    assert diameters(client, planets, "diameter_gt=900&diameter_lt=100000&sort=diameter") == ["7200", "10,465"]
+    assert diameters(client, planets, "edited_since=2015-03-01&edited_before=2015-05-01&sort=edited") == ["unknown", "118000"]
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ("diameter_gt=big", "Invalid value for diameter_gt: big"),
+        ("diameter_near=1", "Unknown filter: diameter_near"),
+        ("name_gt=a", "Unknown filter: name_gt"),
+    ],
+)
+def test_invalid_range_filters(client, query, message):
+    response = client.get("/planets?" + query)
+    assert response.status_code == 400
+    assert response.json["message"] == message